@@ -1,51 +1,208 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, session
-import requests
+from flask import (
+    Flask, Response, render_template, stream_template, request, redirect, url_for, flash, session, jsonify, g,
+    get_flashed_messages, before_render_template, template_rendered,
+)
+import csv
+import hashlib
+import hmac
 import json
 import logging
+import os
+import time
+from datetime import date, datetime, timedelta
+from functools import cached_property
+
+import click
+
+from asaas_client import MAX_PAGE_SIZE, AsaasClient, AsaasError
+from cache import (
+    customer_cache, subscription_cache, payment_cache, listing_cache, page_cache, PAGE_FRESH_TTL,
+    listing_key, get_cached_listing, set_cached_listing, write_through, apply_remote_update, cached_api_keys,
+)
+from fanout import fan_out, call_with_retry
+from jobs import JobQueue
+from revalidate import BackgroundRefresher
+from metrics import (
+    RequestTrace, current_trace, registry, route_requests, route_duration, route_in_flight, template_duration,
+    cache_hits, cache_misses, cache_hit_ratio, cache_entries,
+)
+from store import TABLES, TABLES_BY_OBJECT, SnapshotStore, account_id
+from webhooks import WebhookProcessor
 
 app = Flask(__name__)
 app.secret_key = 'your_secret_key'
 
-base_url = 'https://www.asaas.com/api/v3'
+# URL da API do Asaas (ex.: http://127.0.0.1:5001/api/v3 para o servidor falso de fake_asaas.py)
+base_url = os.environ.get('ASAAS_BASE_URL', 'https://www.asaas.com/api/v3')
+
+# Cliente HTTP compartilhado (pool de conexões reaproveitadas entre as requisições)
+asaas = AsaasClient()
+
+# Banco local com a cópia dos dados do Asaas, atualizado por /sync ou `flask sync-snapshot`
+snapshot_store = SnapshotStore()
+SNAPSHOT_MAX_AGE = int(os.environ.get('SNAPSHOT_MAX_AGE', 3600))
+SNAPSHOT_FULL_SYNC_INTERVAL = int(os.environ.get('SNAPSHOT_FULL_SYNC_INTERVAL', 86400))
+SNAPSHOT_SYNC_BATCH_SIZE = 500
+
+# Filtros de data aceitos pelas listagens do Asaas para a sincronização incremental.
+# Clientes e assinaturas não têm esse filtro e são relidos por completo (só as linhas alteradas são gravadas).
+INCREMENTAL_SYNC_FILTERS = {'payments': 'dateCreated[ge]'}
+
+# Prefixo do externalReference das cobranças criadas pelos alertas em lote (usado como chave de idempotência)
+REMINDER_REFERENCE_PREFIX = 'reminder-'
+
+# Token configurado no painel do Asaas para autenticar as chamadas de webhook em /webhooks/asaas.
+# Também é o segredo dos tokens por conta de /webhooks/asaas/<conta> (veja `flask webhook-config`).
+ASAAS_WEBHOOK_TOKEN = os.environ.get('ASAAS_WEBHOOK_TOKEN')
+
+# Paginação das listas da página inicial (o Asaas devolve no máximo MAX_PAGE_SIZE registros por chamada)
+INDEX_PAGE_SIZE = min(int(os.environ.get('INDEX_PAGE_SIZE', 50)), MAX_PAGE_SIZE)
+SUBSCRIPTION_STATUSES = ('ACTIVE', 'INACTIVE', 'EXPIRED')
+
+# Serve a última versão conhecida da página inicial e a atualiza em segundo plano (stale-while-revalidate)
+INDEX_STALE_WHILE_REVALIDATE = os.environ.get('INDEX_STALE_WHILE_REVALIDATE', '1') == '1'
+
+# Envia a página inicial em partes (cabeçalho e formulários antes das listas ficarem prontas)
+INDEX_STREAMING = os.environ.get('INDEX_STREAMING', '0') == '1'
+
+# Renderiza só a estrutura e os formulários da página inicial; as listas são carregadas pelo navegador
+# a partir de /fragments/<lista>, em paralelo e com rolagem infinita (?progressive=0 renderiza tudo no servidor)
+INDEX_PROGRESSIVE = os.environ.get('INDEX_PROGRESSIVE', '1') == '1'
+
+# Token exigido em /metrics (cabeçalho Authorization: Bearer ...); sem ele o endpoint fica aberto
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+
+# Permite abrir o painel com as chamadas ao Asaas de uma página usando ?timing=1
+TIMING_PANEL_ENABLED = os.environ.get('TIMING_PANEL_ENABLED', '1') == '1'
+
+# Configura o logging (nível definido por LOG_LEVEL, ex.: DEBUG, INFO, WARNING)
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
+logging.basicConfig(level=LOG_LEVEL)
+
+# Função para ler uma listagem completa do Asaas, percorrendo todas as páginas.
+# Para processar registros sem carregar tudo em memória, use asaas.paginate diretamente.
+def list_all(url, api_key, params=None):
+    records = list(asaas.paginate(url, api_key, params))
+    return {'object': 'list', 'hasMore': False, 'totalCount': len(records), 'data': records}
+
+# Função para ler uma listagem completa, servindo do cache enquanto ela estiver válida
+def cached_list_all(url, api_key, key, record_cache, params=None):
+    listing = get_cached_listing(api_key, key, record_cache)
+    if listing is None:
+        listing = list_all(url, api_key, params)
+        set_cached_listing(api_key, key, record_cache, listing)
+    return listing
+
+# Tabelas lidas pelas listas e pela página do cliente; são relidas por completo a cada sincronização
+LIST_TABLES = ('customers', 'subscriptions')
+
+# Função que devolve a conta no banco local se as tabelas pedidas tiverem uma sincronização completa recente.
+# Pagamentos só passam a contar depois da próxima sincronização completa, pois a incremental traz apenas os novos.
+def snapshot_account(api_key, tables=TABLES):
+    account = account_id(api_key)
+    synced_at = snapshot_store.synced_at(account, tables)
+    if synced_at is None or time.time() - synced_at > SNAPSHOT_MAX_AGE:
+        return None
+    return account
+
+# Função para refletir o objeto devolvido por uma operação de escrita no cache e no banco local
+def record_mutation(api_key, record):
+    snapshot_store.upsert_object(account_id(api_key), record)
+    # As páginas montadas não são atualizadas registro a registro; descarta para não mostrar dados anteriores à alteração
+    page_cache.clear(api_key)
+    return write_through(api_key, record)
+
+# Função para sincronizar o banco local com o Asaas, buscando apenas o que mudou quando possível
+def sync_snapshot(api_key, full=False, progress=None):
+    account = account_id(api_key)
+    counts = {}
+    for kind in TABLES:
+        started_at = time.time()
+        params = {}
+        date_filter = INCREMENTAL_SYNC_FILTERS.get(kind)
+        last_sync = snapshot_store.last_sync(account, kind)
+        last_full_sync = snapshot_store.last_sync(account, f'{kind}:full')
+        incremental = (
+            not full and date_filter and last_sync and last_full_sync
+            and started_at - last_full_sync < SNAPSHOT_FULL_SYNC_INTERVAL
+        )
+        if incremental:
+            # O filtro tem granularidade de dia; um dia de folga cobre diferenças de fuso horário
+            params[date_filter] = (date.fromtimestamp(last_sync) - timedelta(days=1)).isoformat()
+
+        batch = []
+        seen_ids = set()
+        counts[kind] = 0
+        for record in asaas.paginate(f'{base_url}/{kind}', api_key, params):
+            batch.append(record)
+            seen_ids.add(record.get('id'))
+            if len(batch) >= SNAPSHOT_SYNC_BATCH_SIZE:
+                counts[kind] += snapshot_store.upsert(account, kind, batch)
+                batch = []
+        counts[kind] += snapshot_store.upsert(account, kind, batch)
+
+        removed = 0
+        snapshot_store.mark_synced(account, kind, started_at)
+        if not incremental:
+            # A leitura completa traz todos os registros da conta; os que ficaram de fora foram excluídos no Asaas
+            removed = snapshot_store.prune(account, kind, seen_ids, started_at)
+            snapshot_store.mark_synced(account, f'{kind}:full', started_at)
+        logging.info('Snapshot sync of %s: %d records, %d removed (%s)',
+                     kind, counts[kind], removed, 'incremental' if incremental else 'full')
+        if progress:
+            progress(len(counts), len(TABLES))
+    return counts
+
+# Função para aplicar um evento de webhook (pagamento, assinatura ou cliente) ao banco local e aos caches.
+# Com a conta da URL do webhook, o evento só altera essa conta (o token dela não vale para as outras),
+# inclusive com registros novos (ex.: CUSTOMER_CREATED); sem ela, são atualizadas as contas que já têm
+# o registro ou o cliente dele.
+def apply_webhook_event(event, account=None):
+    api_keys = {api_key for api_key in cached_api_keys() if account_id(api_key) == account} if account else None
+    for field in TABLES_BY_OBJECT:
+        record = event.get(field)
+        if not isinstance(record, dict) or not record.get('id'):
+            continue
+        record = {'object': field, **record}
+        if event.get('event', '').endswith('_DELETED'):
+            record['deleted'] = True
 
-# Configura o logging
-logging.basicConfig(level=logging.DEBUG)
+        for record_account in [account] if account else snapshot_store.accounts_for(record):
+            if record.get('deleted'):
+                snapshot_store.delete(record_account, TABLES_BY_OBJECT[field], record['id'])
+            else:
+                snapshot_store.upsert_object(record_account, record)
+        apply_remote_update(record, api_keys)
+        logging.debug('Applied webhook event %s (%s) to %s %s', event.get('id'), event.get('event'), field, record['id'])
+
+webhook_processor = WebhookProcessor(apply_webhook_event, snapshot_store)
+webhook_processor.start()
+
+# Token do webhook de uma conta, derivado de ASAAS_WEBHOOK_TOKEN (não precisa ser guardado)
+def webhook_token(account):
+    return hmac.new(ASAAS_WEBHOOK_TOKEN.encode(), account.encode(), hashlib.sha256).hexdigest()
+
+# Atualizações em segundo plano da página inicial, agrupadas por chave de API
+index_refresher = BackgroundRefresher()
+
+# Fila de tarefas demoradas, executadas fora das threads que atendem as requisições
+job_queue = JobQueue()
 
 # Função para atualizar valor de assinatura com logging
 def update_subscription(subscription_id, new_value, new_date, api_key):
     url = f'{base_url}/subscriptions/{subscription_id}'
-    headers = {
-        'Content-Type': 'application/json',
-        'access_token': api_key
-    }
     data = {
         'value': new_value,
         'date': new_date
     }
-    
-    # Log do JSON que está sendo enviado
-    logging.debug(f'Sending JSON to {url}: {json.dumps(data)}')
-    
-    response = requests.put(url, headers=headers, json=data)
-    try:
-        response.raise_for_status()
-        logging.debug(f'Successfully updated subscription: {response.json()}')
-        return response.json(), response.status_code
-    except requests.exceptions.HTTPError as http_err:
-        logging.error(f'HTTP error occurred: {http_err} - {response.text}')
-    except requests.exceptions.RequestException as err:
-        logging.error(f'Error occurred: {err}')
-    except ValueError:
-        logging.error('Invalid JSON received')
-    return {}, response.status_code
+    result = asaas.execute('PUT', url, api_key, json=data)
+    if result.ok:
+        record_mutation(api_key, result.data)
+    return result.data, result.status
 
 # Função para enviar alerta de cobrança com logging
-def send_payment_reminder(customer_id, due_date, value, api_key):
+def send_payment_reminder(customer_id, due_date, value, api_key, external_reference=None):
     url = f'{base_url}/payments'
-    headers = {
-        'Content-Type': 'application/json',
-        'access_token': api_key
-    }
     data = {
         'customer': customer_id,
         'dueDate': due_date,
@@ -53,175 +210,502 @@ def send_payment_reminder(customer_id, due_date, value, api_key):
         'billingType': 'BOLETO',
         'description': 'Mensalidade em atraso'
     }
+    if external_reference:
+        data['externalReference'] = external_reference
+
+    result = asaas.execute('POST', url, api_key, json=data)
+    if result.ok:
+        record_mutation(api_key, result.data)
+    return result.data, result.status
+
+# Função para preencher o nome do cliente nas assinaturas a partir de um mapa id->cliente,
+# buscando individualmente apenas os clientes que não estão na listagem.
+# Devolve cópias das assinaturas: os registros recebidos podem ser os mesmos objetos guardados nos caches
+# (e nas respostas reaproveitadas pelo cliente HTTP) e não devem ser alterados.
+def join_customer_names(subscriptions, customers, api_key):
+    customers_by_id = {customer.get('id'): customer for customer in customers}
+
+    missing_ids = list({
+        subscription.get('customer')
+        for subscription in subscriptions
+        if subscription.get('customer') and subscription.get('customer') not in customers_by_id
+    })
+    results = fan_out(lambda customer_id: get_customer_details(customer_id, api_key), missing_ids)
+    for customer_id, (customer_details, _) in zip(missing_ids, results):
+        customers_by_id[customer_id] = customer_details
+
+    joined = []
+    for subscription in subscriptions:
+        customer_details = customers_by_id.get(subscription.get('customer')) or {}
+        joined.append({**subscription, 'customer_name': customer_details.get('name', 'Nome não disponível')})
+    return joined
+
+# Função para ler page, page_size, status e q (busca pelo nome do cliente) da query string das listagens
+def parse_list_query(args):
+    status = args.get('status', '').upper()
+    return {
+        'page': max(args.get('page', 1, type=int), 1),
+        'page_size': min(max(args.get('page_size', INDEX_PAGE_SIZE, type=int), 1), MAX_PAGE_SIZE),
+        'status': status if status in SUBSCRIPTION_STATUSES else None,
+        'search': args.get('q', '').strip() or None,
+    }
+
+def list_page(records, total, page, page_size):
+    return {'object': 'list', 'hasMore': page * page_size < total, 'totalCount': total, 'data': records}
+
+def name_matches(name, search):
+    return search.casefold() in (name or '').casefold()
+
+# Função para buscar uma única página de uma listagem no Asaas, guardando os registros no cache
+def fetch_page(url, api_key, params, record_cache):
+    result = asaas.execute('GET', url, api_key, params=params)
+    if not result.ok:
+        return {}, result.status
+    records = result.data.get('data', [])
+    record_cache.set_many(api_key, records)
+    return {
+        'object': 'list',
+        'hasMore': bool(result.data.get('hasMore')),
+        'totalCount': result.data.get('totalCount', len(records)),
+        'data': records,
+    }, 200
+
+# Função para obter uma página de clientes, opcionalmente filtrando pelo nome.
+# Usa o banco local ou a listagem completa em cache quando disponíveis; senão busca só a página no Asaas.
+def get_customers_page(api_key, page, page_size, search=None):
+    offset = (page - 1) * page_size
+    account = snapshot_account(api_key, LIST_TABLES)
+    if account:
+        customers, total = snapshot_store.page(account, 'customers', page_size, offset, search=search)
+        return list_page(customers, total, page, page_size), 200
+
+    listing = get_cached_listing(api_key, listing_key('customers'), customer_cache)
+    if listing is not None:
+        customers = [customer for customer in listing['data'] if not search or name_matches(customer.get('name'), search)]
+        return list_page(customers[offset:offset + page_size], len(customers), page, page_size), 200
+
+    params = {'offset': offset, 'limit': page_size}
+    if search:
+        params['name'] = search
+    return fetch_page(f'{base_url}/customers', api_key, params, customer_cache)
+
+# Função para obter uma página de assinaturas com o nome do cliente, filtrando por status e pelo nome do cliente.
+# A API do Asaas não filtra assinaturas pelo nome do cliente; nesse caso (sem banco local) a busca é feita
+# sobre a listagem completa em cache, e apenas a página exibida é devolvida.
+# Os nomes vêm da listagem de clientes em cache, se houver; senão só os clientes da página exibida são buscados
+# (em paralelo, guardados em customer_cache). A listagem completa de clientes só é lida para a busca por nome.
+def get_subscriptions_page(api_key, page, page_size, status=None, search=None):
+    offset = (page - 1) * page_size
+    filters = {'status': status} if status else {}
+    account = snapshot_account(api_key, LIST_TABLES)
+    if account:
+        subscriptions, total = snapshot_store.page(account, 'subscriptions', page_size, offset, search=search, **filters)
+        customers = snapshot_store.get_many(account, 'customers', [s.get('customer') for s in subscriptions])
+        subscriptions = join_customer_names(subscriptions, list(customers.values()), api_key)
+        return list_page(subscriptions, total, page, page_size), 200
 
-    # Log do JSON que está sendo enviado
-    logging.debug(f'Sending JSON to {url}: {json.dumps(data)}')
-    
-    response = requests.post(url, headers=headers, json=data)
-    try:
-        response.raise_for_status()
-        logging.debug(f'Successfully sent payment reminder: {response.json()}')
-        return response.json(), response.status_code
-    except requests.exceptions.HTTPError as http_err:
-        logging.error(f'HTTP error occurred: {http_err} - {response.text}')
-    except requests.exceptions.RequestException as err:
-        logging.error(f'Error occurred: {err}')
-    except ValueError:
-        logging.error('Invalid JSON received')
-    return {}, response.status_code
-
-# Função para obter todas as assinaturas com logging
-def get_all_subscriptions(api_key):
     url = f'{base_url}/subscriptions'
-    headers = {'access_token': api_key}
-    response = requests.get(url, headers=headers)
-    
-    try:
-        response.raise_for_status()
-        subscriptions = response.json()
-        logging.debug(f'Subscriptions received: {subscriptions}')
-        if response.status_code == 200:
-            for subscription in subscriptions.get('data', []):
-                customer_id = subscription.get('customer')
-                customer_details, _ = get_customer_details(customer_id, api_key)
-                subscription['customer_name'] = customer_details.get('name', 'Nome não disponível')
-        return subscriptions, response.status_code
-    except requests.exceptions.HTTPError as http_err:
-        logging.error(f'HTTP error occurred: {http_err} - {response.text}')
-    except requests.exceptions.RequestException as err:
-        logging.error(f'Error occurred: {err}')
-    except ValueError:
-        logging.error('Invalid JSON received')
-    
-    return {}, response.status_code
+    listing = get_cached_listing(api_key, listing_key('subscriptions'), subscription_cache)
+    if search:
+        customers = get_all_customers(api_key)[0].get('data', [])
+    else:
+        cached_customers = get_cached_listing(api_key, listing_key('customers'), customer_cache)
+        customers = cached_customers['data'] if cached_customers else []
+    if listing is None and not search:
+        subscriptions, result_status = fetch_page(url, api_key, {'offset': offset, 'limit': page_size, **filters},
+                                                  subscription_cache)
+        if result_status == 200:
+            subscriptions['data'] = join_customer_names(subscriptions['data'], customers, api_key)
+        return subscriptions, result_status
+
+    if listing is None:
+        try:
+            listing = cached_list_all(url, api_key, listing_key('subscriptions'), subscription_cache)
+        except AsaasError as err:
+            return {}, err.status
+    subscriptions = [s for s in listing['data'] if not status or s.get('status') == status]
+    if search:
+        subscriptions = join_customer_names(subscriptions, customers, api_key)
+        subscriptions = [s for s in subscriptions if name_matches(s['customer_name'], search)]
+    displayed = subscriptions[offset:offset + page_size]
+    if not search:
+        displayed = join_customer_names(displayed, customers, api_key)
+    return list_page(displayed, len(subscriptions), page, page_size), 200
+
+# Função para montar os dados da página inicial (uma página de clientes e uma de assinaturas)
+def build_index_data(api_key, query):
+    customers, _ = get_customers_page(api_key, query['page'], query['page_size'], query['search'])
+    subscriptions, status = get_subscriptions_page(api_key, **query)
+    return {'customers': customers, 'subscriptions': subscriptions, 'status': status, 'as_of': time.time()}
+
+# Função para montar uma página de uma das listas (assinaturas ou clientes), usada pelos fragmentos
+def build_list_data(api_key, kind, query):
+    if kind == 'subscriptions':
+        listing, status = get_subscriptions_page(api_key, **query)
+    else:
+        listing, status = get_customers_page(api_key, query['page'], query['page_size'], query['search'])
+    return {'listing': listing, 'status': status, 'as_of': time.time()}
+
+# Função executada em segundo plano para remontar uma página já servida do cache
+def refresh_page_data(api_key, key, build):
+    data = build()
+    if data['status'] == 200:
+        page_cache.set(api_key, key, data)
+    else:
+        logging.warning('Refresh of %s failed with status %s; keeping the stale page', key[0], data['status'])
+
+# Função para obter os dados de uma página com build(). Com o snapshot local a página é montada na hora;
+# sem ele, a última versão conhecida é servida imediatamente e, se tiver mais de PAGE_FRESH_TTL segundos,
+# atualizada em segundo plano (uma atualização por chave de API por vez).
+def load_page_data(api_key, key, build):
+    account = snapshot_account(api_key, LIST_TABLES)
+    if account or not INDEX_STALE_WHILE_REVALIDATE:
+        data = build()
+        if account:
+            data['as_of'] = snapshot_store.synced_at(account, LIST_TABLES)
+        return data
+
+    data = page_cache.get(api_key, key)
+    if data is None:
+        data = build()
+        if data['status'] == 200:
+            page_cache.set(api_key, key, data)
+    elif time.time() - data['as_of'] > PAGE_FRESH_TTL:
+        index_refresher.submit(api_key, key, lambda key: refresh_page_data(api_key, key, build))
+    return data
+
+def load_index_data(api_key, query):
+    return load_page_data(api_key, ('index', *sorted(query.items())), lambda: build_index_data(api_key, query))
+
+def load_list_data(api_key, kind, query):
+    return load_page_data(api_key, (kind, *sorted(query.items())), lambda: build_list_data(api_key, kind, query))
+
+# Parâmetros de filtro repetidos nos links de paginação e nos fragmentos
+def list_filters(query):
+    filters = {name: value for name, value in (('q', query['search']), ('status', query['status'])) if value}
+    if query['page_size'] != INDEX_PAGE_SIZE:
+        filters['page_size'] = query['page_size']
+    return filters
+
+# Dados das listas da página inicial, buscados só quando o template chega a elas.
+# Com INDEX_STREAMING, o cabeçalho e os formulários já foram enviados ao navegador nesse momento.
+class IndexPage:
+    def __init__(self, api_key, query):
+        self.api_key = api_key
+        self.query = query
+
+    @cached_property
+    def data(self):
+        return load_index_data(self.api_key, self.query)
+
+    @property
+    def error(self):
+        return self.data['status'] != 200
+
+    @property
+    def subscriptions(self):
+        return self.data['subscriptions'].get('data', [])
+
+    @property
+    def customers(self):
+        return self.data['customers'].get('data', [])
 
-# Função para obter detalhes do cliente com logging
+    @property
+    def subscription_total(self):
+        return self.data['subscriptions'].get('totalCount', 0)
+
+    @property
+    def customer_total(self):
+        return self.data['customers'].get('totalCount', 0)
+
+    # O total de páginas considera a maior das duas listas
+    @property
+    def pages(self):
+        return max(1, -(-max(self.subscription_total, self.customer_total) // self.query['page_size']))
+
+    @property
+    def as_of(self):
+        return datetime.fromtimestamp(self.data['as_of']).strftime('%d/%m/%Y %H:%M:%S')
+
+    @property
+    def refreshing(self):
+        return bool(index_refresher.pending(self.api_key))
+
+# Função para obter detalhes do cliente (consultando antes o cache) com logging
 def get_customer_details(customer_id, api_key):
-    url = f'{base_url}/customers/{customer_id}'
-    headers = {'access_token': api_key}
-    response = requests.get(url, headers=headers)
-    
-    try:
-        response.raise_for_status()
-        logging.debug(f'Customer details received: {response.json()}')
-        return response.json(), response.status_code
-    except requests.exceptions.HTTPError as http_err:
-        logging.error(f'HTTP error occurred: {http_err} - {response.text}')
-    except requests.exceptions.RequestException as err:
-        logging.error(f'Error occurred: {err}')
-    except ValueError:
-        logging.error('Invalid JSON received')
-    
-    return {}, response.status_code
+    account = snapshot_account(api_key, LIST_TABLES)
+    stored = snapshot_store.get(account, 'customers', customer_id) if account else None
+    if stored is not None:
+        return stored, 200
+
+    cached = customer_cache.get(api_key, customer_id)
+    if cached is not None:
+        return cached, 200
 
-# Função para obter todos os pagamentos de um cliente com logging
+    result = asaas.execute('GET', f'{base_url}/customers/{customer_id}', api_key)
+    if result.ok:
+        customer_cache.set(api_key, customer_id, result.data)
+    return result.data, result.status
+
+# Função para obter todos os pagamentos de um cliente (todas as páginas) com logging
 def get_customer_payments(customer_id, api_key):
+    account = snapshot_account(api_key, ('payments',))
+    if account:
+        payments = snapshot_store.list(account, 'payments', customer=customer_id)
+        return {'object': 'list', 'hasMore': False, 'totalCount': len(payments), 'data': payments}, 200
+
     url = f'{base_url}/payments'
-    headers = {'access_token': api_key}
     params = {'customer': customer_id}
-    response = requests.get(url, headers=headers, params=params)
-    
     try:
-        response.raise_for_status()
-        logging.debug(f'Customer payments received: {response.json()}')
-        return response.json(), response.status_code
-    except requests.exceptions.HTTPError as http_err:
-        logging.error(f'HTTP error occurred: {http_err} - {response.text}')
-    except requests.exceptions.RequestException as err:
-        logging.error(f'Error occurred: {err}')
-    except ValueError:
-        logging.error('Invalid JSON received')
-    
-    return {}, response.status_code
+        return cached_list_all(url, api_key, listing_key('payments', customer_id), payment_cache, params), 200
+    except AsaasError as err:
+        return {}, err.status
 
 # Função para atualizar a data de vencimento do pagamento com logging
 def update_due_date(payment_id, new_due_date, api_key):
     url = f'{base_url}/payments/{payment_id}'
-    headers = {
-        'Content-Type': 'application/json',
-        'access_token': api_key
-    }
     data = {'dueDate': new_due_date}
-    
-    # Log do JSON que está sendo enviado
-    logging.debug(f'Sending JSON to {url}: {json.dumps(data)}')
-    
-    response = requests.put(url, headers=headers, json=data)
-    try:
-        response.raise_for_status()
-        logging.debug(f'Successfully updated due date: {response.json()}')
-        return response.json(), response.status_code
-    except requests.exceptions.HTTPError as http_err:
-        logging.error(f'HTTP error occurred: {http_err} - {response.text}')
-    except requests.exceptions.RequestException as err:
-        logging.error(f'Error occurred: {err}')
-    except ValueError:
-        logging.error('Invalid JSON received')
-    return {}, response.status_code
+    result = asaas.execute('PUT', url, api_key, json=data)
+    if result.ok:
+        record_mutation(api_key, result.data)
+    return result.data, result.status
 
 # Função para atualizar a data da mensalidade com logging
 def update_subscription_due_date(subscription_id, new_due_date, api_key):
     url = f'{base_url}/subscriptions/{subscription_id}'
-    headers = {
-        'Content-Type': 'application/json',
-        'access_token': api_key
-    }
     data = {'dueDate': new_due_date}
-    
-    # Log do JSON que está sendo enviado
-    logging.debug(f'Sending JSON to {url}: {json.dumps(data)}')
-    
-    response = requests.put(url, headers=headers, json=data)
-    try:
-        response.raise_for_status()
-        logging.debug(f'Successfully updated subscription due date: {response.json()}')
-        return response.json(), response.status_code
-    except requests.exceptions.HTTPError as http_err:
-        logging.error(f'HTTP error occurred: {http_err} - {response.text}')
-    except requests.exceptions.RequestException as err:
-        logging.error(f'Error occurred: {err}')
-    except ValueError:
-        logging.error('Invalid JSON received')
-    return {}, response.status_code
+    result = asaas.execute('PUT', url, api_key, json=data)
+    if result.ok:
+        record_mutation(api_key, result.data)
+    return result.data, result.status
 
 # Função para debitar a próxima cobrança com logging
 def debit_next_charge(subscription_id, api_key):
     url = f'{base_url}/subscriptions/{subscription_id}/debit'
-    headers = {'access_token': api_key}
-    response = requests.post(url, headers=headers)
+    result = asaas.execute('POST', url, api_key)
+    # Sem o objeto atualizado na resposta, descarta a assinatura do cache para ser relida
+    if result.ok and not record_mutation(api_key, result.data):
+        subscription_cache.pop(api_key, subscription_id)
+    return result.data, result.status
+
+# Função para ler a lista de atualizações em lote (JSON ou CSV com subscription_id, value, date)
+def parse_bulk_subscription_updates(req):
+    if req.is_json:
+        payload = req.get_json(silent=True)
+        rows = payload.get('items') if isinstance(payload, dict) else payload
+        if not isinstance(rows, list):
+            raise ValueError('Esperada uma lista de itens com subscription_id, value e date.')
+    else:
+        upload = req.files.get('file')
+        text = upload.read().decode('utf-8-sig') if upload else req.form.get('csv') or req.get_data(as_text=True)
+        lines = [line for line in text.splitlines() if line.strip()]
+        if lines and not lines[0].lower().startswith('subscription_id'):
+            lines.insert(0, 'subscription_id,value,date')
+        rows = list(csv.DictReader(lines))
+
+    items = []
+    for line_number, row in enumerate(rows, start=1):
+        if not isinstance(row, dict):
+            raise ValueError(f'Item {line_number}: formato inválido.')
+        try:
+            items.append({
+                'subscription_id': str(row['subscription_id']).strip(),
+                'value': float(row['value']),
+                'date': str(row['date']).strip(),
+            })
+        except (KeyError, TypeError, ValueError):
+            raise ValueError(f'Item {line_number}: subscription_id, value e date são obrigatórios.')
+    if not items:
+        raise ValueError('Nenhuma assinatura informada.')
+    return items
+
+# Função para atualizar várias assinaturas em paralelo, com novas tentativas, devolvendo o resultado de cada item
+def bulk_update_subscriptions(items, api_key, progress=None):
+    def update_item(item):
+        result = {'subscription_id': item['subscription_id'], 'value': item['value'], 'date': item['date']}
+        _, status = call_with_retry(
+            lambda: update_subscription(item['subscription_id'], item['value'], item['date'], api_key)
+        )
+        return {**result, 'success': status == 200, 'status': status}
+
+    results = fan_out(update_item, items, progress=progress)
+    succeeded = sum(1 for result in results if result['success'])
+    return {'total': len(results), 'succeeded': succeeded, 'failed': len(results) - succeeded, 'results': results}
+
+# Função para obter todos os pagamentos vencidos da conta (de todos os clientes) com logging.
+# Sempre consulta o Asaas: o banco local pode ter pagamentos já quitados ainda como OVERDUE
+# (a sincronização incremental não relê o status dos pagamentos existentes), e eles gerariam cobranças.
+def get_overdue_payments(api_key):
     try:
-        response.raise_for_status()
-        if response.text:
-            logging.debug(f'Debit next charge response: {response.json()}')
-            return response.json(), response.status_code
-        else:
-            return {}, response.status_code
-    except requests.exceptions.HTTPError as http_err:
-        logging.error(f'HTTP error occurred: {http_err} - {response.text}')
-    except requests.exceptions.RequestException as err:
-        logging.error(f'Error occurred: {err}')
-    except ValueError:
-        logging.error('Invalid JSON received')
-    return {}, response.status_code
-
-# Função para obter todos os clientes com logging
+        return list_all(f'{base_url}/payments', api_key, {'status': 'OVERDUE'})['data'], 200
+    except AsaasError as err:
+        return [], err.status
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+# Função para agrupar os pagamentos vencidos por cliente, com a chave de idempotência de cada alerta.
+# A chave depende só da conta, do cliente e dos pagamentos em aberto (não da data do alerta), então reexecutar
+# o lote, mesmo com outra data de vencimento, nunca cobra os mesmos pagamentos duas vezes.
+def group_overdue_payments(payments, due_date, api_key):
+    by_customer = {}
+    for payment in payments:
+        # Cobranças geradas pelos próprios alertas não entram em novos alertas
+        if (payment.get('externalReference') or '').startswith(REMINDER_REFERENCE_PREFIX):
+            continue
+        by_customer.setdefault(payment.get('customer'), []).append(payment)
+
+    account = account_id(api_key)
+    groups = []
+    for customer_id, customer_payments in by_customer.items():
+        payment_ids = sorted(payment['id'] for payment in customer_payments)
+        digest = hashlib.sha256('|'.join([account, customer_id, *payment_ids]).encode()).hexdigest()
+        groups.append({
+            'customer_id': customer_id,
+            'payment_ids': payment_ids,
+            'value': round(sum(float(payment.get('value') or 0) for payment in customer_payments), 2),
+            'due_date': due_date,
+            'idempotency_key': f'{REMINDER_REFERENCE_PREFIX}{digest[:32]}',
+        })
+    return groups
+
+# Função para enviar os alertas de cobrança de todos os clientes com pagamentos vencidos.
+# Em dry_run apenas devolve a prévia, sem criar nenhuma cobrança.
+def bulk_send_reminders(due_date, api_key, dry_run=False, progress=None):
+    started_at = time.perf_counter()
+    payments, status = get_overdue_payments(api_key)
+    if status != 200:
+        return {'error': 'Erro ao buscar pagamentos vencidos.', 'status': status}
+
+    account = account_id(api_key)
+    groups = group_overdue_payments(payments, due_date, api_key)
+    latencies = []
+
+    def send_group(group):
+        if dry_run:
+            already_sent = snapshot_store.has_reminder(group['idempotency_key'])
+            return {**group, 'result': 'skipped' if already_sent else 'pending'}
+        if not snapshot_store.claim_reminder(group['idempotency_key'], account, group['customer_id']):
+            return {**group, 'result': 'skipped'}
+
+        # Sem call_with_retry: após um timeout a cobrança pode ter sido criada, e repetir o POST
+        # poderia cobrar duas vezes (o cliente HTTP já repete as respostas 429, que são seguras)
+        call_started_at = time.perf_counter()
+        payment, status = send_payment_reminder(
+            group['customer_id'], due_date, group['value'], api_key, group['idempotency_key']
+        )
+        latencies.append(time.perf_counter() - call_started_at)
+
+        if status == 200:
+            snapshot_store.complete_reminder(group['idempotency_key'], payment.get('id'))
+            return {**group, 'result': 'sent', 'status': status, 'payment_id': payment.get('id')}
+        # Só libera a chave quando o Asaas recusou a cobrança; em falhas ambíguas (timeout, 5xx)
+        # ela continua reservada para que uma nova execução não crie a cobrança em dobro
+        if 400 <= status < 500:
+            snapshot_store.release_reminder(group['idempotency_key'])
+        return {**group, 'result': 'failed', 'status': status}
+
+    results = fan_out(send_group, groups, progress=progress)
+    elapsed = time.perf_counter() - started_at
+    counts = {result: sum(1 for item in results if item['result'] == result)
+              for result in ('sent', 'skipped', 'failed', 'pending')}
+    return {
+        'dry_run': dry_run,
+        'overdue_payments': len(payments),
+        'customers': len(groups),
+        'total_value': round(sum(group['value'] for group in groups), 2),
+        **counts,
+        'elapsed_seconds': round(elapsed, 3),
+        'throughput_per_second': round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        'latency_seconds': {
+            'p50': round(percentile(latencies, 50), 3),
+            'p95': round(percentile(latencies, 95), 3),
+            'max': round(max(latencies, default=0.0), 3),
+        },
+        'results': results,
+    }
+
+# Função para obter todos os clientes (todas as páginas) com logging
 def get_all_customers(api_key):
-    url = f'{base_url}/customers'
-    headers = {'access_token': api_key}
-    response = requests.get(url, headers=headers)
-    
+    account = snapshot_account(api_key, LIST_TABLES)
+    if account:
+        customers = snapshot_store.list(account, 'customers')
+        return {'object': 'list', 'hasMore': False, 'totalCount': len(customers), 'data': customers}, 200
+
     try:
-        response.raise_for_status()
-        logging.debug(f'All customers received: {response.json()}')
-        return response.json(), response.status_code
-    except requests.exceptions.HTTPError as http_err:
-        logging.error(f'HTTP error occurred: {http_err} - {response.text}')
-    except requests.exceptions.RequestException as err:
-        logging.error(f'Error occurred: {err}')
-    except ValueError:
-        logging.error('Invalid JSON received')
-    
-    return {}, response.status_code
+        return cached_list_all(f'{base_url}/customers', api_key, listing_key('customers'), customer_cache), 200
+    except AsaasError as err:
+        return {}, err.status
+
+# Métricas por rota (duração, status e requisições em andamento) e o trace da requisição,
+# devolvido no cabeçalho Server-Timing (tempo no Asaas, cache, banco local e template)
+@app.before_request
+def start_request_timer():
+    g.request_started_at = time.perf_counter()
+    g.trace = RequestTrace()
+    g.trace_token = current_trace.set(g.trace)
+    route_in_flight.inc()
+
+@app.after_request
+def record_request_metrics(response):
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    route_requests.inc(route=route, method=request.method, status=response.status_code)
+    route_duration.observe(time.perf_counter() - g.request_started_at, route=route, method=request.method)
+    if 'trace' in g and request.endpoint != 'metrics':
+        response.headers['Server-Timing'] = g.trace.server_timing()
+    return response
+
+@app.teardown_request
+def finish_request_timer(exc):
+    if g.pop('request_started_at', None) is not None:
+        route_in_flight.dec()
+        current_trace.reset(g.pop('trace_token'))
+
+# Disponibiliza o trace para o painel de chamadas quando a página é aberta com ?timing=1
+@app.context_processor
+def inject_timing_panel():
+    show = TIMING_PANEL_ENABLED and request.args.get('timing') == '1' and 'trace' in g
+    return {'timing_trace': g.trace if show else None}
+
+# Tempo de renderização de cada template, medido pelos sinais do Flask
+def start_template_timer(sender, template, context, **extra):
+    g.template_started_at = time.perf_counter()
+
+def record_template_metrics(sender, template, context, **extra):
+    started_at = g.pop('template_started_at', None)
+    if started_at is not None:
+        elapsed = time.perf_counter() - started_at
+        template_duration.observe(elapsed, template=template.name)
+        if 'trace' in g:
+            g.trace.add_duration('template', elapsed)
+
+before_render_template.connect(start_template_timer, app)
+template_rendered.connect(record_template_metrics, app)
+
+# Copia as estatísticas dos caches para as métricas a cada leitura de /metrics
+def collect_cache_metrics():
+    caches = {'customer': customer_cache, 'subscription': subscription_cache,
+              'payment': payment_cache, 'listing': listing_cache, 'page': page_cache}
+    for name, record_cache in caches.items():
+        stats = record_cache.stats()
+        lookups = stats['hits'] + stats['misses']
+        cache_hits.set(stats['hits'], cache=name)
+        cache_misses.set(stats['misses'], cache=name)
+        cache_hit_ratio.set(stats['hits'] / lookups if lookups else 0.0, cache=name)
+        cache_entries.set(stats['size'], cache=name)
+
+registry.add_collector(collect_cache_metrics)
+
+@app.route('/metrics')
+def metrics():
+    if METRICS_TOKEN:
+        token = request.headers.get('Authorization', '').removeprefix('Bearer ')
+        if not hmac.compare_digest(token.encode(), METRICS_TOKEN.encode()):
+            return jsonify({'error': 'invalid token'}), 401
+    return Response(registry.render(), mimetype='text/plain; version=0.0.4')
 
 @app.route('/login', methods=['GET', 'POST'])
 def login():
@@ -238,13 +722,44 @@ def index():
         return redirect(url_for('login'))
     
     api_key = session['api_key']
-    subscriptions, status = get_all_subscriptions(api_key)
-    customers, _ = get_all_customers(api_key)
-    
-    if status != 200:
-        flash('Erro ao buscar assinaturas. Verifique a chave da API e tente novamente.', 'danger')
-    
-    return render_template('index.html', subscriptions=subscriptions.get('data', []), customers=customers.get('data', []))
+    query = parse_list_query(request.args)
+
+    filters = list_filters(query)
+    progressive = INDEX_PROGRESSIVE and request.args.get('progressive') != '0'
+    if INDEX_PROGRESSIVE and not progressive:
+        filters['progressive'] = '0'
+
+    context = {'index': IndexPage(api_key, query), 'query': query, 'filters': filters, 'statuses': SUBSCRIPTION_STATUSES,
+               'progressive': progressive, 'fragment_filters': list_filters(query)}
+    if progressive or not INDEX_STREAMING:
+        return render_template('index.html', **context)
+
+    # A sessão é gravada antes do corpo ser enviado: as mensagens flash precisam ser lidas (e removidas) aqui.
+    # Server-Timing e a duração da rota nas métricas passam a medir só até o início do envio.
+    get_flashed_messages(with_categories=True)
+    return Response(stream_template('index.html', **context), mimetype='text/html')
+
+# Itens (<li>) de uma página da lista de assinaturas ou de clientes, carregados pela página inicial.
+# O último item aponta para a próxima página; o total e a data dos dados vão nos headers.
+@app.route('/fragments/<any(subscriptions, customers):kind>')
+def list_fragment(kind):
+    if 'api_key' not in session:
+        return '', 401
+
+    query = parse_list_query(request.args)
+    data = load_list_data(session['api_key'], kind, query)
+    listing = data['listing']
+    next_url = None
+    if listing.get('hasMore'):
+        next_url = url_for('list_fragment', kind=kind, page=query['page'] + 1, **list_filters(query))
+
+    response = app.make_response(render_template(
+        '_list_fragment.html', kind=kind, records=listing.get('data', []), next_url=next_url,
+        error=data['status'] != 200,
+    ))
+    response.headers['X-Total-Count'] = str(listing.get('totalCount', 0))
+    response.headers['X-Data-As-Of'] = datetime.fromtimestamp(data['as_of']).strftime('%d/%m/%Y %H:%M:%S')
+    return response
 
 @app.route('/update_subscription', methods=['POST'])
 def update_sub():
@@ -264,6 +779,28 @@ def update_sub():
 
     return redirect(url_for('index'))
 
+@app.route('/bulk_update_subscriptions', methods=['POST'])
+def bulk_update_subscriptions_route():
+    if 'api_key' not in session:
+        return redirect(url_for('login'))
+
+    try:
+        items = parse_bulk_subscription_updates(request)
+    except ValueError as err:
+        if request.is_json:
+            return jsonify({'error': str(err)}), 400
+        flash(str(err), 'danger')
+        return redirect(url_for('index'))
+
+    api_key = session['api_key']
+    job_id = job_queue.submit(account_id(api_key), 'bulk_update_subscriptions', bulk_update_subscriptions, items, api_key)
+    status_url = url_for('job_status', job_id=job_id)
+    if request.is_json:
+        return jsonify({'job_id': job_id, 'status_url': status_url}), 202
+
+    flash(f'Atualização de {len(items)} assinaturas iniciada. Acompanhe o resultado em {status_url}', 'success')
+    return redirect(url_for('index'))
+
 @app.route('/send_reminder', methods=['POST'])
 def send_reminder():
     if 'api_key' not in session:
@@ -280,6 +817,33 @@ def send_reminder():
         flash('Erro ao enviar alerta.', 'danger')
     return redirect(url_for('index'))
 
+@app.route('/bulk_send_reminders', methods=['POST'])
+def bulk_send_reminders_route():
+    if 'api_key' not in session:
+        return redirect(url_for('login'))
+
+    params = request.get_json(silent=True) if request.is_json else request.form
+    due_date = (params or {}).get('due_date')
+    dry_run = str((params or {}).get('dry_run', '')).lower() in ('1', 'true', 'on')
+    if not due_date:
+        if request.is_json:
+            return jsonify({'error': 'due_date é obrigatório.'}), 400
+        flash('Informe a data de vencimento dos alertas.', 'danger')
+        return redirect(url_for('index'))
+
+    # A prévia também percorre todos os pagamentos vencidos da conta, então roda na fila como o envio
+    api_key = session['api_key']
+    kind = 'bulk_send_reminders_preview' if dry_run else 'bulk_send_reminders'
+    job_id = job_queue.submit(account_id(api_key), kind, bulk_send_reminders, due_date, api_key, dry_run=dry_run)
+    status_url = url_for('job_status', job_id=job_id)
+    if request.is_json:
+        return jsonify({'job_id': job_id, 'status_url': status_url}), 202
+    if dry_run:
+        flash(f'Prévia dos alertas iniciada. Acompanhe o resultado em {status_url}', 'success')
+    else:
+        flash(f'Envio dos alertas iniciado. Acompanhe o resultado em {status_url}', 'success')
+    return redirect(url_for('index'))
+
 @app.route('/update_due_date', methods=['POST'])
 def update_due_date_route():
     if 'api_key' not in session:
@@ -330,6 +894,71 @@ def debit_next_charge_route():
 
     return redirect(url_for('index'))
 
+@app.route('/sync', methods=['POST'])
+def sync_route():
+    if 'api_key' not in session:
+        return redirect(url_for('login'))
+
+    api_key = session['api_key']
+    # Uma sincronização por conta de cada vez; pedidos durante uma em andamento apontam para ela
+    job_id, created = job_queue.submit_once(account_id(api_key), 'sync_snapshot', sync_snapshot, api_key,
+                                            full=request.form.get('full') == '1')
+    status_url = url_for('job_status', job_id=job_id)
+    if created:
+        flash(f'Sincronização iniciada. Acompanhe em {status_url}', 'success')
+    else:
+        flash(f'Já existe uma sincronização em andamento. Acompanhe em {status_url}', 'danger')
+    return redirect(url_for('index'))
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    if 'api_key' not in session:
+        return redirect(url_for('login'))
+
+    job = job_queue.get(job_id)
+    if job is None or job['account'] != account_id(session['api_key']):
+        return jsonify({'error': 'job not found'}), 404
+    job.pop('account')
+    job.pop('owner')
+    return jsonify(job)
+
+@app.cli.command('sync-snapshot')
+@click.argument('api_key', envvar='ASAAS_API_KEY')
+@click.option('--full', is_flag=True, help='Relê todos os registros, ignorando os filtros de data.')
+def sync_snapshot_command(api_key, full):
+    counts = sync_snapshot(api_key, full=full)
+    click.echo(json.dumps(counts))
+
+@app.cli.command('webhook-config')
+@click.argument('api_key', envvar='ASAAS_API_KEY')
+def webhook_config_command(api_key):
+    if not ASAAS_WEBHOOK_TOKEN:
+        raise click.ClickException('ASAAS_WEBHOOK_TOKEN não configurado.')
+    account = account_id(api_key)
+    click.echo(json.dumps({'path': f'/webhooks/asaas/{account}', 'token': webhook_token(account)}))
+
+@app.route('/webhooks/asaas', methods=['POST'])
+@app.route('/webhooks/asaas/<account>', methods=['POST'])
+def asaas_webhook(account=None):
+    token = request.headers.get('asaas-access-token', '')
+    expected = None
+    if ASAAS_WEBHOOK_TOKEN:
+        expected = webhook_token(account) if account else ASAAS_WEBHOOK_TOKEN
+    if not expected or not hmac.compare_digest(token.encode(), expected.encode()):
+        return jsonify({'error': 'invalid token'}), 401
+
+    event = request.get_json(silent=True)
+    if not isinstance(event, dict) or not event.get('id'):
+        return jsonify({'error': 'invalid event'}), 400
+
+    # O evento é gravado antes da resposta e aplicado em segundo plano.
+    # Eventos repetidos (o Asaas reenvia até receber 200) são confirmados sem serem reaplicados.
+    if snapshot_store.record_event(event, account):
+        webhook_processor.submit(event, account)
+    else:
+        logging.debug('Duplicate webhook event ignored: %s', event['id'])
+    return jsonify({'received': True})
+
 @app.route('/customer/<customer_id>')
 def customer(customer_id):
     if 'api_key' not in session:
@@ -344,5 +973,64 @@ def customer(customer_id):
 
     return render_template('customer.html', customer=customer_details, payments=customer_payments.get('data', []))
 
+# Endpoints JSON com os mesmos dados do painel, para ferramentas internas.
+# Autenticam pela sessão ou pelo header access_token (a mesma chave de API do Asaas).
+def request_api_key():
+    return request.headers.get('access_token') or session.get('api_key')
+
+# Função para montar a resposta JSON com ETag, devolvendo 304 quando o cliente já tem a mesma versão
+def conditional_json(payload):
+    response = jsonify(payload)
+    response.add_etag()
+    response.headers['Cache-Control'] = 'private, no-cache'
+    response.vary.update(('Cookie', 'access_token'))
+    return response.make_conditional(request)
+
+# Chave inválida e registro inexistente são repassados; as demais falhas do Asaas viram 502
+def api_error(status):
+    return jsonify({'error': 'Asaas request failed', 'status': status}), status if status in (401, 403, 404) else 502
+
+def api_list(listing, query):
+    return {**listing, 'page': query['page'], 'pageSize': query['page_size']}
+
+@app.route('/api/subscriptions')
+def api_subscriptions():
+    api_key = request_api_key()
+    if not api_key:
+        return jsonify({'error': 'missing api key'}), 401
+
+    query = parse_list_query(request.args)
+    subscriptions, status = get_subscriptions_page(api_key, **query)
+    if status != 200:
+        return api_error(status)
+    return conditional_json(api_list(subscriptions, query))
+
+@app.route('/api/customers')
+def api_customers():
+    api_key = request_api_key()
+    if not api_key:
+        return jsonify({'error': 'missing api key'}), 401
+
+    query = parse_list_query(request.args)
+    customers, status = get_customers_page(api_key, query['page'], query['page_size'], query['search'])
+    if status != 200:
+        return api_error(status)
+    return conditional_json(api_list(customers, query))
+
+@app.route('/api/customers/<customer_id>/payments')
+def api_customer_payments(customer_id):
+    api_key = request_api_key()
+    if not api_key:
+        return jsonify({'error': 'missing api key'}), 401
+
+    query = parse_list_query(request.args)
+    payments, status = get_customer_payments(customer_id, api_key)
+    if status != 200:
+        return api_error(status)
+    records = payments.get('data', [])
+    offset = (query['page'] - 1) * query['page_size']
+    page = list_page(records[offset:offset + query['page_size']], len(records), query['page'], query['page_size'])
+    return conditional_json(api_list(page, query))
+
 if __name__ == '__main__':
     app.run(debug=True)
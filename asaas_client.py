@@ -0,0 +1,394 @@
+import hashlib
+import json
+import logging
+import os
+import random
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import Future, ThreadPoolExecutor
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlencode
+
+import requests
+from cachetools import LRUCache
+from requests.adapters import HTTPAdapter
+
+from metrics import (
+    InFlight, current_trace, endpoint_label, observe_upstream, scheduler_throttled, scheduler_wait,
+    upstream_coalesced, upstream_decode, upstream_in_flight, upstream_revalidations, with_current_trace,
+)
+
+# Configurações do pool de conexões com a API do Asaas
+POOL_CONNECTIONS = int(os.environ.get('ASAAS_POOL_CONNECTIONS', 4))
+POOL_MAXSIZE = int(os.environ.get('ASAAS_POOL_MAXSIZE', 20))
+REQUEST_TIMEOUT = float(os.environ.get('ASAAS_TIMEOUT', 30))
+
+# Paginação das listagens (o Asaas aceita no máximo 100 registros por página)
+MAX_PAGE_SIZE = 100
+PAGE_SIZE = min(int(os.environ.get('ASAAS_PAGE_SIZE', MAX_PAGE_SIZE)), MAX_PAGE_SIZE)
+PAGE_PREFETCH = os.environ.get('ASAAS_PAGE_PREFETCH', '1') == '1'
+
+# Limite de requisições por chave de API (taxa contínua e rajada) e novas tentativas após HTTP 429
+RATE_LIMIT_PER_SECOND = float(os.environ.get('ASAAS_RATE_LIMIT', 10))
+RATE_LIMIT_BURST = int(os.environ.get('ASAAS_RATE_BURST', 20))
+THROTTLE_RETRIES = int(os.environ.get('ASAAS_THROTTLE_RETRIES', 4))
+THROTTLE_BACKOFF = float(os.environ.get('ASAAS_THROTTLE_BACKOFF', 0.5))
+THROTTLE_BACKOFF_MAX = 30.0
+
+# GETs idênticos em andamento ao mesmo tempo compartilham uma única chamada ao Asaas (single-flight)
+SINGLE_FLIGHT = os.environ.get('ASAAS_SINGLE_FLIGHT', '1') == '1'
+
+# Validadores (ETag/Last-Modified), hash e corpo já decodificado dos últimos GETs, para requisições
+# condicionais e para não decodificar de novo respostas iguais às anteriores (0 desativa)
+VALIDATOR_CACHE_SIZE = int(os.environ.get('ASAAS_VALIDATOR_CACHE_SIZE', 2000))
+
+# Quantidade máxima de chaves de API com headers e balde de fichas guardados (as usadas há mais tempo são
+# descartadas), para que chaves inválidas enviadas às rotas não façam o estado crescer sem limite
+MAX_API_KEYS = int(os.environ.get('ASAAS_MAX_API_KEYS', 1000))
+
+# Log dos corpos enviados e recebidos: 'full' (JSON truncado em LOG_MAX_CHARS) ou 'summary' (só ids e tamanhos)
+LOG_PAYLOADS = os.environ.get('LOG_PAYLOADS', 'full')
+LOG_MAX_CHARS = int(os.environ.get('LOG_MAX_CHARS', 2000))
+LOG_SUMMARY_IDS = 10
+
+
+# Corpo de requisição/resposta formatado apenas quando o registro de log é de fato emitido,
+# evitando serializar respostas grandes quando o nível de log as descartaria
+class LazyPayload:
+    __slots__ = ('payload',)
+
+    def __init__(self, payload):
+        self.payload = payload
+
+    def __str__(self):
+        if LOG_PAYLOADS == 'summary':
+            return summarize_payload(self.payload)
+        text = self.payload if isinstance(self.payload, str) else json.dumps(self.payload, ensure_ascii=False, default=str)
+        if len(text) > LOG_MAX_CHARS:
+            return f'{text[:LOG_MAX_CHARS]}... ({len(text)} chars)'
+        return text
+
+
+# Resumo de um corpo do Asaas com apenas os ids e a quantidade de registros
+def summarize_payload(payload):
+    if isinstance(payload, dict) and isinstance(payload.get('data'), list):
+        records = payload['data']
+        ids = [record.get('id') for record in records[:LOG_SUMMARY_IDS] if isinstance(record, dict)]
+        more = ', ...' if len(records) > LOG_SUMMARY_IDS else ''
+        return f'list of {len(records)} records (ids: {", ".join(map(str, ids))}{more})'
+    if isinstance(payload, dict):
+        name = ' '.join(str(part) for part in (payload.get('object', 'object'), payload.get('id')) if part)
+        return f'{name} ({len(payload)} fields)'
+    if isinstance(payload, (str, bytes, list)):
+        return f'{type(payload).__name__} of length {len(payload)}'
+    return type(payload).__name__
+
+
+# Balde de fichas (token bucket) de uma chave de API. Cada requisição consome uma ficha;
+# sem fichas disponíveis, a requisição espera na fila em vez de falhar.
+class TokenBucket:
+    def __init__(self, rate=RATE_LIMIT_PER_SECOND, capacity=RATE_LIMIT_BURST):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = threading.Lock()
+
+    # Reserva uma ficha e espera até ela estar disponível; devolve o tempo de espera em segundos
+    def acquire(self):
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            delay = max(-self.tokens / self.rate, self.paused_until - now, 0.0)
+        if delay:
+            time.sleep(delay)
+        return delay
+
+    # Suspende as requisições da chave (após 429 ou quando o Asaas informa que o limite acabou)
+    def pause(self, seconds):
+        with self._lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+
+# Agrupa chamadas idênticas em andamento: a primeira executa func e as que chegarem enquanto ela
+# não terminou esperam e recebem o mesmo resultado (ou a mesma exceção).
+# do() devolve (resultado, compartilhado), com compartilhado=True para quem só esperou.
+class SingleFlight:
+    def __init__(self):
+        self.shared = 0
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, func):
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+            else:
+                self.shared += 1
+        if not leader:
+            return future.result(), True
+
+        try:
+            result = func()
+        except BaseException as err:
+            future.set_exception(err)
+            raise
+        else:
+            future.set_result(result)
+            return result, False
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+
+# Chave que identifica um GET: chave de API, URL e parâmetros (em ordem fixa)
+def request_key(api_key, url, params):
+    return api_key, url, tuple(sorted((name, str(value)) for name, value in (params or {}).items()))
+
+
+# Última resposta válida de um GET: validadores enviados pelo Asaas, hash do corpo e o corpo decodificado
+Validated = namedtuple('Validated', ['etag', 'last_modified', 'digest', 'data'])
+
+
+# Resultado de uma chamada à API: corpo JSON já decodificado (uma única vez), status HTTP,
+# duração em segundos e a mensagem de erro (None quando a chamada deu certo)
+class ApiResult(namedtuple('ApiResult', ['data', 'status', 'elapsed', 'error'])):
+    __slots__ = ()
+
+    @property
+    def ok(self):
+        return self.error is None
+
+
+# Erro levantado pela paginação quando uma página não pôde ser lida
+class AsaasError(Exception):
+    def __init__(self, result):
+        super().__init__(result.error)
+        self.result = result
+
+    @property
+    def status(self):
+        return self.result.status
+
+
+def conditional_headers(validated):
+    headers = {}
+    if validated.etag:
+        headers['If-None-Match'] = validated.etag
+    if validated.last_modified:
+        headers['If-Modified-Since'] = validated.last_modified
+    return headers
+
+
+# Tempo de espera antes de repetir uma requisição que recebeu 429: usa o Retry-After
+# quando presente e, sem ele, backoff exponencial com jitter
+def throttle_delay(response, attempt, backoff=THROTTLE_BACKOFF):
+    retry_after = response.headers.get('Retry-After')
+    if retry_after:
+        try:
+            seconds = float(retry_after)
+        except ValueError:
+            try:
+                seconds = parsedate_to_datetime(retry_after).timestamp() - time.time()
+            except (TypeError, ValueError):
+                seconds = None
+        if seconds is not None:
+            return min(max(seconds, 0.0), THROTTLE_BACKOFF_MAX) + random.uniform(0, backoff)
+    return random.uniform(0, min(THROTTLE_BACKOFF_MAX, backoff * 2 ** attempt))
+
+
+# Cliente HTTP do Asaas: uma única sessão com pool de conexões keep-alive,
+# compartilhada por todas as chaves de API (cada chave tem seus próprios headers)
+class AsaasClient:
+    def __init__(self, pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE, timeout=REQUEST_TIMEOUT,
+                 rate_limit=RATE_LIMIT_PER_SECOND, burst=RATE_LIMIT_BURST, throttle_retries=THROTTLE_RETRIES,
+                 single_flight=SINGLE_FLIGHT, validator_cache_size=VALIDATOR_CACHE_SIZE, max_api_keys=MAX_API_KEYS):
+        self.timeout = timeout
+        self.single_flight = SingleFlight() if single_flight else None
+        self._validators = LRUCache(maxsize=validator_cache_size) if validator_cache_size else None
+        self.rate_limit = rate_limit
+        self.burst = burst
+        self.throttle_retries = throttle_retries
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.session.headers.update({'Connection': 'keep-alive'})
+        self._headers = LRUCache(maxsize=max_api_keys)
+        self._buckets = LRUCache(maxsize=max_api_keys)
+        self._lock = threading.Lock()
+
+    # Headers padrão de cada chave de API, montados uma única vez
+    def headers_for(self, api_key):
+        with self._lock:
+            headers = self._headers.get(api_key)
+            if headers is None:
+                headers = self._headers[api_key] = {'access_token': api_key}
+            return headers
+
+    def bucket_for(self, api_key):
+        with self._lock:
+            bucket = self._buckets.get(api_key)
+            if bucket is None:
+                bucket = self._buckets[api_key] = TokenBucket(self.rate_limit, self.burst)
+            return bucket
+
+    # Cada requisição passa pelo balde de fichas da chave; respostas 429 suspendem a chave
+    # pelo tempo indicado e a requisição é repetida, em vez de falhar para o usuário
+    def request(self, method, url, api_key, **kwargs):
+        headers = dict(self.headers_for(api_key))
+        headers.update(kwargs.pop('headers', None) or {})
+        kwargs.setdefault('timeout', self.timeout)
+        bucket = self.bucket_for(api_key)
+        endpoint = endpoint_label(url)
+
+        for attempt in range(self.throttle_retries + 1):
+            waited = bucket.acquire()
+            scheduler_wait.observe(waited)
+
+            try:
+                with InFlight(upstream_in_flight) as call:
+                    response = self.session.request(method, url, headers=headers, **kwargs)
+            except requests.exceptions.RequestException:
+                observe_upstream(method, endpoint, 'error', 0, call.elapsed)
+                self._trace_call(method, url, kwargs.get('params'), 'error', call, 0)
+                raise
+            observe_upstream(method, endpoint, response.status_code, len(response.content), call.elapsed)
+            self._trace_call(method, url, kwargs.get('params'), response.status_code, call, len(response.content))
+
+            self._observe_rate_limit(bucket, response)
+            if response.status_code != 429 or attempt == self.throttle_retries:
+                return response
+
+            scheduler_throttled.inc()
+            delay = throttle_delay(response, attempt)
+            bucket.pause(delay)
+            logging.warning('Asaas rate limit reached (%s %s); retrying in %.2fs', method, url, delay)
+        return response
+
+    # Executa uma chamada à API e devolve um ApiResult: trata erros de conexão, HTTP e JSON
+    # sempre da mesma forma, decodifica o corpo uma única vez e mede o tempo da chamada.
+    # GETs com a mesma chave de API, URL e parâmetros em andamento ao mesmo tempo viram uma única chamada
+    # (o ApiResult, e portanto o mesmo objeto data, é compartilhado entre quem esperava por ele).
+    def execute(self, method, url, api_key, **kwargs):
+        if self.single_flight is None or method != 'GET' or set(kwargs) - {'params'}:
+            return self._execute(method, url, api_key, **kwargs)
+
+        key = request_key(api_key, url, kwargs.get('params'))
+        result, shared = self.single_flight.do(key, lambda: self._execute(method, url, api_key, **kwargs))
+        if shared:
+            upstream_coalesced.inc(endpoint=endpoint_label(url))
+        return result
+
+    def _execute(self, method, url, api_key, **kwargs):
+        if 'json' in kwargs:
+            logging.debug('Sending JSON to %s: %s', url, LazyPayload(kwargs['json']))
+
+        # GETs repetidos são enviados como condicionais quando a resposta anterior trouxe validadores
+        key = validated = None
+        if method == 'GET' and self._validators is not None:
+            key = request_key(api_key, url, kwargs.get('params'))
+            with self._lock:
+                validated = self._validators.get(key)
+            if validated is not None:
+                kwargs['headers'] = {**(kwargs.get('headers') or {}), **conditional_headers(validated)}
+
+        started_at = time.perf_counter()
+        try:
+            response = self.request(method, url, api_key, **kwargs)
+        except requests.exceptions.RequestException as err:
+            logging.error('Error occurred: %s', err)
+            return ApiResult({}, 502, time.perf_counter() - started_at, str(err))
+
+        # 304: o registro não mudou; devolve o corpo guardado como se tivesse sido relido
+        if response.status_code == 304 and validated is not None:
+            upstream_revalidations.inc(result='not_modified')
+            return ApiResult(validated.data, 200, time.perf_counter() - started_at, None)
+
+        try:
+            response.raise_for_status()
+            digest = hashlib.blake2b(response.content, digest_size=16).digest() if key else None
+            if validated is not None and digest == validated.digest:
+                # Mesmo conteúdo da última resposta (sem validadores): reaproveita o corpo já decodificado
+                upstream_revalidations.inc(result='unchanged')
+                data = validated.data
+            else:
+                decode_started_at = time.perf_counter()
+                data = response.json() if response.content else {}
+                upstream_decode.observe(time.perf_counter() - decode_started_at, endpoint=endpoint_label(url))
+                if validated is not None:
+                    upstream_revalidations.inc(result='changed')
+            if key and data:
+                stored = Validated(response.headers.get('ETag'), response.headers.get('Last-Modified'), digest, data)
+                with self._lock:
+                    self._validators[key] = stored
+        except requests.exceptions.HTTPError as http_err:
+            logging.error('HTTP error occurred: %s - %s', http_err, response.text[:LOG_MAX_CHARS])
+            return ApiResult({}, response.status_code, time.perf_counter() - started_at, str(http_err))
+        except ValueError:
+            logging.error('Invalid JSON received')
+            return ApiResult({}, response.status_code, time.perf_counter() - started_at, 'Invalid JSON received')
+
+        elapsed = time.perf_counter() - started_at
+        logging.debug('%s %s -> %s in %.3fs (%d bytes): %s',
+                      method, url, response.status_code, elapsed, len(response.content), LazyPayload(data))
+        return ApiResult(data, response.status_code, elapsed, None)
+
+    # Respeita os headers RateLimit-Remaining/RateLimit-Reset enviados pelo Asaas
+    def _observe_rate_limit(self, bucket, response):
+        remaining = response.headers.get('RateLimit-Remaining')
+        reset = response.headers.get('RateLimit-Reset')
+        if remaining is not None and reset is not None:
+            try:
+                if int(remaining) <= 0:
+                    bucket.pause(min(float(reset), THROTTLE_BACKOFF_MAX))
+            except ValueError:
+                pass
+
+    # Registra a chamada no trace da requisição do app em andamento (Server-Timing e painel de chamadas)
+    def _trace_call(self, method, url, params, status, call, nbytes):
+        trace = current_trace.get()
+        if trace is not None:
+            if params:
+                url = f'{url}?{urlencode(params)}'
+            trace.add_call(method, url, status, call.started_at, call.elapsed, nbytes)
+
+    # Gerador que percorre uma listagem página a página (offset/limit/hasMore),
+    # opcionalmente buscando a próxima página enquanto a atual é consumida
+    def paginate(self, url, api_key, params=None, page_size=PAGE_SIZE, prefetch=PAGE_PREFETCH):
+        params = dict(params or {})
+        offset = int(params.pop('offset', 0))
+        page_size = max(1, min(int(page_size), MAX_PAGE_SIZE))
+
+        def fetch_page(page_offset):
+            result = self.execute('GET', url, api_key, params={**params, 'offset': page_offset, 'limit': page_size})
+            if not result.ok:
+                raise AsaasError(result)
+            return result.data
+
+        executor = ThreadPoolExecutor(max_workers=1) if prefetch else None
+        try:
+            page = fetch_page(offset)
+            while True:
+                records = page.get('data', [])
+                has_more = bool(page.get('hasMore')) and bool(records)
+                offset += len(records)
+
+                next_page = executor.submit(with_current_trace(fetch_page), offset) if has_more and executor else None
+                yield from records
+
+                if not has_more:
+                    return
+                page = next_page.result() if next_page else fetch_page(offset)
+        finally:
+            if executor:
+                executor.shutdown(wait=False, cancel_futures=True)
+
+    def close(self):
+        self.session.close()
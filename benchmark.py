@@ -0,0 +1,186 @@
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date, datetime, timedelta, timezone
+
+import click
+
+import fake_asaas
+
+# Benchmark das rotas do painel contra o servidor falso do Asaas (fake_asaas.py), pelo test client do Flask.
+# Ex.: python benchmark.py --sizes 10,1000,10000 --latencies 0,0.05 --output bench.json
+FAKE_BASE_URL = 'https://fake.asaas/api/v3'
+DEFAULT_SIZES = '10,1000,10000'
+DEFAULT_LATENCIES = '0,0.05'
+DEFAULT_ITERATIONS = 20
+
+
+# Importa o app com o banco local num diretório temporário e logs só de avisos, para não medir a escrita do log
+def load_dashboard(workdir):
+    os.environ.setdefault('SNAPSHOT_DB_PATH', os.path.join(workdir, 'snapshot.db'))
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+    import app as dashboard
+    return dashboard
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def parse_list(value, cast):
+    return [cast(item) for item in value.split(',') if item.strip()]
+
+
+# Rotas medidas: nome -> função que recebe o test client e o número da iteração e faz a requisição
+def build_routes(fake):
+    subscriptions = fake.lists['subscriptions'] or [{'id': 'sub_missing', 'customer': 'cus_missing'}]
+    payments = fake.lists['payments'] or [{'id': 'pay_missing', 'customer': 'cus_missing'}]
+    due_date = (date.today() + timedelta(days=10)).isoformat()
+
+    def pick(records, iteration):
+        return records[iteration * 7919 % len(records)]
+
+    return {
+        'GET /': lambda client, i: client.get('/'),
+        'GET /?progressive=0': lambda client, i: client.get('/?progressive=0'),
+        'GET /fragments/subscriptions': lambda client, i: client.get(f'/fragments/subscriptions?page={i % 5 + 1}'),
+        'GET /fragments/customers': lambda client, i: client.get(f'/fragments/customers?page={i % 5 + 1}'),
+        'GET /customer/<id>': lambda client, i: client.get(f'/customer/{pick(subscriptions, i)["customer"]}'),
+        'POST /update_subscription': lambda client, i: client.post('/update_subscription', data={
+            'subscription_id': pick(subscriptions, i)['id'], 'new_value': '99.90', 'new_date': due_date,
+        }),
+        'POST /update_subscription_due_date': lambda client, i: client.post('/update_subscription_due_date', data={
+            'subscription_id': pick(subscriptions, i)['id'], 'new_due_date': due_date,
+        }),
+        'POST /update_due_date': lambda client, i: client.post('/update_due_date', data={
+            'payment_id': pick(payments, i)['id'], 'new_due_date': due_date,
+        }),
+        'POST /send_reminder': lambda client, i: client.post('/send_reminder', data={
+            'customer_id': pick(subscriptions, i)['customer'], 'due_date': due_date, 'value': '10.00',
+        }),
+        'POST /debit_next_charge': lambda client, i: client.post('/debit_next_charge', data={
+            'subscription_id': pick(subscriptions, i)['id'],
+        }),
+    }
+
+
+# Prepara o app para um cenário: cliente HTTP novo apontando para o servidor falso e caches vazios
+def prepare(dashboard, fake, rate_limit):
+    client = dashboard.AsaasClient(rate_limit=rate_limit, burst=max(int(rate_limit), 1))
+    client.session.mount(f'{FAKE_BASE_URL}/', fake_asaas.FakeAsaasAdapter(fake_asaas.create_app(fake)))
+    dashboard.asaas = client
+    dashboard.base_url = FAKE_BASE_URL
+    for record_cache in (dashboard.customer_cache, dashboard.subscription_cache,
+                         dashboard.payment_cache, dashboard.listing_cache, dashboard.page_cache):
+        record_cache.clear()
+
+
+def test_client(dashboard, api_key):
+    client = dashboard.app.test_client()
+    with client.session_transaction() as session:
+        session['api_key'] = api_key
+    return client
+
+
+def measure(dashboard, fake, client, request, iterations):
+    durations = []
+    upstream_calls = []
+    errors = 0
+    for iteration in range(iterations):
+        calls_before = fake.requests
+        started_at = time.perf_counter()
+        response = request(client, iteration)
+        durations.append(time.perf_counter() - started_at)
+        upstream_calls.append(fake.requests - calls_before)
+        if response.status_code >= 400:
+            errors += 1
+    return {
+        'iterations': iterations,
+        'p50_ms': round(dashboard.percentile(durations, 50) * 1000, 2),
+        'p95_ms': round(dashboard.percentile(durations, 95) * 1000, 2),
+        'p99_ms': round(dashboard.percentile(durations, 99) * 1000, 2),
+        'max_ms': round(max(durations) * 1000, 2),
+        'upstream_calls_mean': round(sum(upstream_calls) / len(upstream_calls), 2),
+        'upstream_calls_max': max(upstream_calls),
+        'errors': errors,
+    }
+
+
+# Executa todas as rotas para um tamanho de conta e uma latência do Asaas.
+# A memória de pico é medida à parte (tracemalloc deixa as requisições mais lentas), com os caches vazios.
+def run_scenario(dashboard, subscriptions, latency, iterations, rate_limit, snapshot):
+    customers = max(1, round(subscriptions / fake_asaas.SUBSCRIPTION_RATIO))
+    fake = fake_asaas.FakeAsaas(customers=customers, latency=latency)
+    routes = build_routes(fake)
+    api_key = f'bench-{subscriptions}-{latency}-{time.time_ns()}'
+
+    prepare(dashboard, fake, rate_limit)
+    client = test_client(dashboard, api_key)
+    if snapshot:
+        dashboard.sync_snapshot(api_key)
+
+    results = {'GET /?progressive=0 (cold)': measure(dashboard, fake, client, routes['GET /?progressive=0'], 1)}
+    for name, request in routes.items():
+        results[name] = measure(dashboard, fake, client, request, iterations)
+
+    prepare(dashboard, fake, rate_limit)
+    tracemalloc.start()
+    for request in routes.values():
+        request(client, 0)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        'subscriptions': len(fake.lists['subscriptions']),
+        'customers': customers,
+        'payments': len(fake.lists['payments']),
+        'latency_s': latency,
+        'snapshot': snapshot,
+        'peak_memory_mb': round(peak / 1024 / 1024, 2),
+        'routes': results,
+    }
+
+
+@click.command()
+@click.option('--sizes', default=DEFAULT_SIZES, help='Quantidades de assinaturas das contas, separadas por vírgula.')
+@click.option('--latencies', default=DEFAULT_LATENCIES, help='Latências do Asaas em segundos, separadas por vírgula.')
+@click.option('--iterations', default=DEFAULT_ITERATIONS, type=int, help='Requisições medidas por rota.')
+@click.option('--rate-limit', default=1000.0, type=float, help='Limite de requisições por segundo do cliente HTTP.')
+@click.option('--snapshot', is_flag=True, help='Sincroniza o banco local antes de medir.')
+@click.option('--output', type=click.Path(dir_okay=False), help='Arquivo JSON de saída (padrão: stdout).')
+def main(sizes, latencies, iterations, rate_limit, snapshot, output):
+    with tempfile.TemporaryDirectory() as workdir:
+        dashboard = load_dashboard(workdir)
+        report = {
+            'commit': git_commit(),
+            'python': platform.python_version(),
+            'started_at': datetime.now(timezone.utc).isoformat(),
+            'settings': {'iterations': iterations, 'rate_limit': rate_limit, 'snapshot': snapshot},
+            'scenarios': [],
+        }
+        for size in parse_list(sizes, int):
+            for latency in parse_list(latencies, float):
+                click.echo(f'{size} assinaturas, latência {latency}s...', err=True)
+                report['scenarios'].append(run_scenario(dashboard, size, latency, iterations, rate_limit, snapshot))
+
+    payload = json.dumps(report, indent=2)
+    if output:
+        with open(output, 'w') as file:
+            file.write(payload + '\n')
+    else:
+        sys.stdout.write(payload + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,198 @@
+import os
+import threading
+
+from cachetools import LRUCache, TTLCache
+
+from metrics import timed
+
+# Configurações dos caches (tempo de vida em segundos e quantidade máxima de registros por chave de API)
+CACHE_MAXSIZE = int(os.environ.get('CACHE_MAXSIZE', 20000))
+CUSTOMER_CACHE_TTL = int(os.environ.get('CUSTOMER_CACHE_TTL', 600))
+RECORD_CACHE_TTL = int(os.environ.get('RECORD_CACHE_TTL', 300))
+LISTING_CACHE_TTL = int(os.environ.get('LISTING_CACHE_TTL', 120))
+
+# Páginas já montadas da página inicial, servidas enquanto são atualizadas em segundo plano
+# (stale-while-revalidate): ficam frescas por PAGE_FRESH_TTL e são descartadas após PAGE_STALE_TTL
+PAGE_CACHE_MAXSIZE = int(os.environ.get('PAGE_CACHE_MAXSIZE', 256))
+PAGE_FRESH_TTL = int(os.environ.get('PAGE_FRESH_TTL', 30))
+PAGE_STALE_TTL = int(os.environ.get('PAGE_STALE_TTL', 86400))
+
+# Quantidade máxima de chaves de API com cache em cada RecordCache (as usadas há mais tempo são descartadas)
+CACHE_MAX_API_KEYS = int(os.environ.get('CACHE_MAX_API_KEYS', 1000))
+
+
+# Cache de registros do Asaas separado por chave de API, com expiração (TTL),
+# descarte LRU ao atingir o tamanho máximo e contadores de acertos/falhas
+class RecordCache:
+    def __init__(self, maxsize, ttl, max_api_keys=CACHE_MAX_API_KEYS):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._caches = LRUCache(maxsize=max_api_keys)
+        self._lock = threading.Lock()
+
+    def _cache_for(self, api_key):
+        cache = self._caches.get(api_key)
+        if cache is None:
+            cache = self._caches[api_key] = TTLCache(maxsize=self.maxsize, ttl=self.ttl)
+        return cache
+
+    # Uma consulta sem cache para a chave é só uma falha: o cache da chave é criado apenas ao gravar
+    @timed('cache')
+    def get(self, api_key, key):
+        with self._lock:
+            cache = self._caches.get(api_key)
+            value = cache.get(key) if cache is not None else None
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return value
+
+    @timed('cache')
+    def set(self, api_key, key, value):
+        with self._lock:
+            self._cache_for(api_key)[key] = value
+
+    # Armazena vários registros de uma vez, usando o campo 'id' como chave
+    @timed('cache')
+    def set_many(self, api_key, records):
+        with self._lock:
+            cache = self._cache_for(api_key)
+            for record in records:
+                if record.get('id'):
+                    cache[record['id']] = record
+
+    # Atualiza o registro em todas as chaves de API (ou nas de only) que já o têm em cache
+    def refresh(self, key, value, only=None):
+        with self._lock:
+            api_keys = [
+                api_key for api_key, cache in self._caches.items()
+                if key in cache and (only is None or api_key in only)
+            ]
+            for api_key in api_keys:
+                self._caches[api_key][key] = value
+            return api_keys
+
+    # Remove o registro do cache de todas as chaves de API (ou das de only)
+    def discard(self, key, only=None):
+        with self._lock:
+            for api_key, cache in self._caches.items():
+                if only is None or api_key in only:
+                    cache.pop(key, None)
+
+    def api_keys_holding(self, key):
+        with self._lock:
+            return [api_key for api_key, cache in self._caches.items() if key in cache]
+
+    def api_keys(self):
+        with self._lock:
+            return list(self._caches)
+
+    def pop(self, api_key, key):
+        with self._lock:
+            cache = self._caches.get(api_key)
+            return cache.pop(key, None) if cache is not None else None
+
+    def clear(self, api_key=None):
+        with self._lock:
+            if api_key is None:
+                self._caches.clear()
+            else:
+                self._caches.pop(api_key, None)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'size': sum(len(cache) for cache in self._caches.values()),
+            }
+
+
+customer_cache = RecordCache(CACHE_MAXSIZE, CUSTOMER_CACHE_TTL)
+subscription_cache = RecordCache(CACHE_MAXSIZE, RECORD_CACHE_TTL)
+payment_cache = RecordCache(CACHE_MAXSIZE, RECORD_CACHE_TTL)
+
+# Listagens guardam apenas a ordem dos ids; os registros ficam nos caches acima
+listing_cache = RecordCache(CACHE_MAXSIZE, LISTING_CACHE_TTL)
+
+page_cache = RecordCache(PAGE_CACHE_MAXSIZE, PAGE_STALE_TTL)
+
+caches_by_object = {
+    'customer': customer_cache,
+    'subscription': subscription_cache,
+    'payment': payment_cache,
+}
+
+
+# Chave da listagem em cache de cada tipo de objeto do Asaas
+def listing_key(kind, customer_id=None):
+    return (kind, customer_id) if customer_id else kind
+
+
+# Monta uma listagem a partir do cache; devolve None se a listagem ou algum registro expirou
+def get_cached_listing(api_key, key, record_cache):
+    ids = listing_cache.get(api_key, key)
+    if ids is None:
+        return None
+
+    records = []
+    for record_id in ids:
+        record = record_cache.get(api_key, record_id)
+        if record is None:
+            return None
+        records.append(record)
+    return {'object': 'list', 'hasMore': False, 'totalCount': len(records), 'data': records}
+
+
+def set_cached_listing(api_key, key, record_cache, listing):
+    records = listing.get('data', [])
+    record_cache.set_many(api_key, records)
+    listing_cache.set(api_key, key, [record['id'] for record in records if record.get('id')])
+
+
+# Atualiza o cache com o objeto devolvido por uma operação de escrita (write-through).
+# Cobranças novas também entram na listagem de pagamentos do cliente, se ela estiver em cache.
+def write_through(api_key, record):
+    record_cache = caches_by_object.get(record.get('object'))
+    if record_cache is None or not record.get('id'):
+        return False
+
+    record_cache.set(api_key, record['id'], record)
+    if record['object'] == 'payment' and record.get('customer'):
+        _append_to_payment_listing(api_key, record)
+    return True
+
+
+def _append_to_payment_listing(api_key, payment):
+    key = listing_key('payments', payment['customer'])
+    ids = listing_cache.get(api_key, key)
+    if ids is not None and payment['id'] not in ids:
+        listing_cache.set(api_key, key, ids + [payment['id']])
+
+
+# Chaves de API com algum registro nos caches
+def cached_api_keys():
+    return {api_key for record_cache in caches_by_object.values() for api_key in record_cache.api_keys()}
+
+
+# Aplica um objeto recebido por webhook aos caches de todas as chaves que o conhecem, ou só às chaves
+# de only (as da conta do webhook). Objetos removidos saem do cache, e a listagem que os continha será relida.
+def apply_remote_update(record, only=None):
+    record_cache = caches_by_object.get(record.get('object'))
+    if record_cache is None or not record.get('id'):
+        return
+
+    if record.get('deleted'):
+        record_cache.discard(record['id'], only)
+        return
+
+    api_keys = record_cache.refresh(record['id'], record, only)
+    if record['object'] == 'payment' and record.get('customer'):
+        holding = [api_key for api_key in customer_cache.api_keys_holding(record['customer'])
+                   if only is None or api_key in only]
+        for api_key in set(api_keys) | set(holding):
+            record_cache.set(api_key, record['id'], record)
+            _append_to_payment_listing(api_key, record)
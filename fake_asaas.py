@@ -0,0 +1,367 @@
+import io
+import itertools
+import os
+import random
+import threading
+import time
+from datetime import date, timedelta
+
+import click
+import requests
+from flask import Flask, jsonify, request
+from requests.adapters import BaseAdapter
+
+# Servidor local que imita os endpoints do Asaas usados pelo app, para testes de carga sem rede.
+# Rode com `python fake_asaas.py` e aponte o app para ele com ASAAS_BASE_URL=http://127.0.0.1:5001/api/v3
+FAKE_ASAAS_CUSTOMERS = int(os.environ.get('FAKE_ASAAS_CUSTOMERS', 10000))
+FAKE_ASAAS_LATENCY = float(os.environ.get('FAKE_ASAAS_LATENCY', 0))
+FAKE_ASAAS_JITTER = float(os.environ.get('FAKE_ASAAS_JITTER', 0))
+FAKE_ASAAS_ERROR_RATE = float(os.environ.get('FAKE_ASAAS_ERROR_RATE', 0))
+FAKE_ASAAS_THROTTLE_RATE = float(os.environ.get('FAKE_ASAAS_THROTTLE_RATE', 0))
+FAKE_ASAAS_SEED = int(os.environ.get('FAKE_ASAAS_SEED', 42))
+# O Asaas não documenta ETag; ligue para medir as requisições condicionais (If-None-Match -> 304)
+FAKE_ASAAS_ETAGS = os.environ.get('FAKE_ASAAS_ETAGS', '0') == '1'
+
+API_PREFIX = '/api/v3'
+MAX_LIMIT = 100
+PAYMENTS_PER_SUBSCRIPTION = 3
+# Fração dos clientes gerados que têm uma assinatura
+SUBSCRIPTION_RATIO = 0.8
+FIRST_NAMES = ['Ana', 'Bruno', 'Carla', 'Diego', 'Elisa', 'Fábio', 'Gabriela', 'Heitor', 'Isabela', 'João']
+LAST_NAMES = ['Silva', 'Souza', 'Oliveira', 'Santos', 'Lima', 'Costa', 'Pereira', 'Almeida', 'Rocha', 'Botelho']
+
+# Filtros aceitos em cada listagem: parâmetro da query -> campo do registro
+LIST_FILTERS = {
+    'customers': {'name': 'name', 'email': 'email'},
+    'subscriptions': {'customer': 'customer', 'status': 'status'},
+    'payments': {
+        'customer': 'customer', 'subscription': 'subscription', 'status': 'status',
+        'externalReference': 'externalReference',
+    },
+}
+
+
+# Gera clientes, assinaturas (para uma fração SUBSCRIPTION_RATIO dos clientes) e as últimas cobranças
+# de cada assinatura, sempre os mesmos para a mesma semente. As listagens ficam em ordem de criação
+# decrescente, como no Asaas.
+def generate_dataset(customers=FAKE_ASAAS_CUSTOMERS, seed=FAKE_ASAAS_SEED, today=None):
+    rng = random.Random(seed)
+    today = today or date.today()
+    dataset = {'customers': [], 'subscriptions': [], 'payments': []}
+
+    for index in range(customers):
+        customer_id = f'cus_{index:012d}'
+        created = today - timedelta(days=rng.randint(30, 720))
+        name = f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)} {index}'
+        dataset['customers'].append({
+            'object': 'customer',
+            'id': customer_id,
+            'dateCreated': created.isoformat(),
+            'name': name,
+            'email': f'cliente{index}@example.com',
+            'phone': f'11{rng.randint(30000000, 39999999)}',
+            'deleted': False,
+        })
+        if rng.random() >= SUBSCRIPTION_RATIO:
+            continue
+
+        subscription_id = f'sub_{index:012d}'
+        value = round(rng.uniform(29.9, 499.9), 2)
+        next_due = today + timedelta(days=rng.randint(1, 28))
+        dataset['subscriptions'].append({
+            'object': 'subscription',
+            'id': subscription_id,
+            'dateCreated': created.isoformat(),
+            'customer': customer_id,
+            'billingType': 'BOLETO',
+            'cycle': 'MONTHLY',
+            'value': value,
+            'nextDueDate': next_due.isoformat(),
+            'status': 'ACTIVE' if rng.random() < 0.9 else 'INACTIVE',
+            'deleted': False,
+        })
+        for month in range(PAYMENTS_PER_SUBSCRIPTION, 0, -1):
+            due = next_due - timedelta(days=30 * month)
+            if due > today:
+                status = 'PENDING'
+            else:
+                status = rng.choices(['RECEIVED', 'OVERDUE', 'CONFIRMED'], weights=[80, 15, 5])[0]
+            dataset['payments'].append({
+                'object': 'payment',
+                'id': f'pay_{index:012d}{month}',
+                'dateCreated': (due - timedelta(days=10)).isoformat(),
+                'customer': customer_id,
+                'subscription': subscription_id,
+                'billingType': 'BOLETO',
+                'value': value,
+                'status': status,
+                'dueDate': due.isoformat(),
+                'externalReference': None,
+                'deleted': False,
+            })
+
+    for records in dataset.values():
+        records.sort(key=lambda record: (record['dateCreated'], record['id']), reverse=True)
+    return dataset
+
+
+# Dados e comportamento (latência, erros, 429) do servidor falso; pode ser alterado com o servidor rodando
+class FakeAsaas:
+    def __init__(self, customers=FAKE_ASAAS_CUSTOMERS, latency=FAKE_ASAAS_LATENCY, jitter=FAKE_ASAAS_JITTER,
+                 error_rate=FAKE_ASAAS_ERROR_RATE, throttle_rate=FAKE_ASAAS_THROTTLE_RATE, seed=FAKE_ASAAS_SEED,
+                 etags=FAKE_ASAAS_ETAGS):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.etags = etags
+        self.requests = 0
+        self._rng = random.Random(seed)
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self.load(generate_dataset(customers, seed))
+
+    def load(self, dataset):
+        with self._lock:
+            self.lists = dataset
+            self.by_id = {kind: {record['id']: record for record in records} for kind, records in dataset.items()}
+            self.payments_by_customer = {}
+            for payment in dataset['payments']:
+                self.payments_by_customer.setdefault(payment['customer'], []).append(payment)
+
+    def configure(self, **settings):
+        for name, value in settings.items():
+            if name not in ('latency', 'jitter', 'error_rate', 'throttle_rate'):
+                raise ValueError(f'Unknown setting {name}')
+            setattr(self, name, float(value))
+
+    # Espera a latência configurada e sorteia as falhas injetadas; devolve a resposta de erro, se houver
+    def simulate(self):
+        with self._lock:
+            self.requests += 1
+            delay = max(0.0, self.latency + self._rng.uniform(-self.jitter, self.jitter))
+            roll = self._rng.random()
+        if delay:
+            time.sleep(delay)
+        if roll < self.throttle_rate:
+            response = jsonify({'errors': [{'code': 'too_many_requests', 'description': 'Too many requests'}]})
+            response.status_code = 429
+            response.headers['Retry-After'] = '1'
+            response.headers['RateLimit-Remaining'] = '0'
+            response.headers['RateLimit-Reset'] = '1'
+            return response
+        if roll < self.throttle_rate + self.error_rate:
+            return error('internal_error', 'Erro simulado pelo servidor falso', 500)
+        return None
+
+    def listing(self, kind, args):
+        offset = max(int(args.get('offset', 0)), 0)
+        limit = min(max(int(args.get('limit', 10)), 1), MAX_LIMIT)
+        filters = {
+            field: args[param] for param, field in LIST_FILTERS[kind].items() if args.get(param)
+        }
+        created_since = args.get('dateCreated[ge]')
+        # Como no Asaas, o filtro de nome busca por parte do nome
+        name = filters.pop('name', '').casefold()
+
+        with self._lock:
+            if kind == 'payments' and 'customer' in filters:
+                records = self.payments_by_customer.get(filters['customer'], [])
+            else:
+                records = self.lists[kind]
+            matches = [
+                record for record in records
+                if not record['deleted']
+                and all(record.get(field) == value for field, value in filters.items())
+                and (not created_since or record['dateCreated'] >= created_since)
+                and (not name or name in record['name'].casefold())
+            ]
+        page = matches[offset:offset + limit]
+        return {
+            'object': 'list',
+            'hasMore': offset + limit < len(matches),
+            'totalCount': len(matches),
+            'limit': limit,
+            'offset': offset,
+            'data': page,
+        }
+
+    def get(self, kind, record_id):
+        with self._lock:
+            record = self.by_id[kind].get(record_id)
+        return None if record is None or record['deleted'] else record
+
+    def update(self, kind, record_id, changes):
+        with self._lock:
+            record = self.by_id[kind].get(record_id)
+            if record is None or record['deleted']:
+                return None
+            record.update(changes)
+            return dict(record)
+
+    def create_payment(self, payload):
+        with self._lock:
+            payment = {
+                'object': 'payment',
+                'id': f'pay_new{next(self._ids):09d}',
+                'dateCreated': date.today().isoformat(),
+                'customer': payload.get('customer'),
+                'subscription': payload.get('subscription'),
+                'billingType': payload.get('billingType', 'BOLETO'),
+                'value': payload.get('value'),
+                'status': 'PENDING',
+                'dueDate': payload.get('dueDate'),
+                'description': payload.get('description'),
+                'externalReference': payload.get('externalReference'),
+                'deleted': False,
+            }
+            self.lists['payments'].insert(0, payment)
+            self.by_id['payments'][payment['id']] = payment
+            self.payments_by_customer.setdefault(payment['customer'], []).insert(0, payment)
+            return dict(payment)
+
+
+def error(code, description, status):
+    return jsonify({'errors': [{'code': code, 'description': description}]}), status
+
+
+# Aplicação Flask com os endpoints do Asaas servidos a partir de um FakeAsaas
+def create_app(fake=None):
+    fake = fake or FakeAsaas()
+    fake_app = Flask(__name__)
+    fake_app.config['FAKE_ASAAS'] = fake
+
+    @fake_app.before_request
+    def authenticate_and_simulate():
+        if request.path.startswith('/__fake__'):
+            return None
+        if not request.headers.get('access_token'):
+            return error('invalid_access_token', 'A chave de API fornecida é inválida', 401)
+        return fake.simulate()
+
+    @fake_app.after_request
+    def add_etag(response):
+        if fake.etags and request.method == 'GET' and response.status_code == 200:
+            response.add_etag()
+            return response.make_conditional(request)
+        return response
+
+    @fake_app.route(f'{API_PREFIX}/<any(customers, subscriptions, payments):kind>')
+    def list_records(kind):
+        try:
+            return jsonify(fake.listing(kind, request.args))
+        except ValueError:
+            return error('invalid_parameter', 'offset e limit devem ser números inteiros', 400)
+
+    @fake_app.route(f'{API_PREFIX}/<any(customers, subscriptions, payments):kind>/<record_id>')
+    def get_record(kind, record_id):
+        record = fake.get(kind, record_id)
+        if record is None:
+            return error('invalid_object', f'Registro {record_id} não encontrado', 404)
+        return jsonify(record)
+
+    @fake_app.route(f'{API_PREFIX}/subscriptions/<subscription_id>', methods=['PUT', 'POST'])
+    def update_subscription(subscription_id):
+        payload = request.get_json(silent=True) or {}
+        changes = {}
+        if 'value' in payload:
+            changes['value'] = float(payload['value'])
+        if payload.get('dueDate') or payload.get('nextDueDate') or payload.get('date'):
+            changes['nextDueDate'] = payload.get('dueDate') or payload.get('nextDueDate') or payload.get('date')
+        record = fake.update('subscriptions', subscription_id, changes)
+        if record is None:
+            return error('invalid_object', f'Assinatura {subscription_id} não encontrada', 404)
+        return jsonify(record)
+
+    @fake_app.route(f'{API_PREFIX}/subscriptions/<subscription_id>/debit', methods=['POST'])
+    def debit_subscription(subscription_id):
+        subscription = fake.get('subscriptions', subscription_id)
+        if subscription is None:
+            return error('invalid_object', f'Assinatura {subscription_id} não encontrada', 404)
+        payment = fake.create_payment({
+            'customer': subscription['customer'],
+            'subscription': subscription_id,
+            'value': subscription['value'],
+            'dueDate': subscription['nextDueDate'],
+        })
+        return jsonify(fake.update('payments', payment['id'], {'status': 'CONFIRMED'}))
+
+    @fake_app.route(f'{API_PREFIX}/payments', methods=['POST'])
+    def create_payment():
+        payload = request.get_json(silent=True) or {}
+        if fake.get('customers', payload.get('customer')) is None:
+            return error('invalid_customer', 'Cliente inexistente', 400)
+        return jsonify(fake.create_payment(payload))
+
+    @fake_app.route(f'{API_PREFIX}/payments/<payment_id>', methods=['PUT', 'POST'])
+    def update_payment(payment_id):
+        payload = request.get_json(silent=True) or {}
+        changes = {field: payload[field] for field in ('dueDate', 'value', 'description') if field in payload}
+        record = fake.update('payments', payment_id, changes)
+        if record is None:
+            return error('invalid_object', f'Cobrança {payment_id} não encontrada', 404)
+        return jsonify(record)
+
+    # Altera latência e taxas de falha sem reiniciar (ex.: POST /__fake__/config {"latency": 0.2})
+    @fake_app.route('/__fake__/config', methods=['GET', 'POST'])
+    def fake_config():
+        if request.method == 'POST':
+            try:
+                fake.configure(**(request.get_json(silent=True) or {}))
+            except (TypeError, ValueError) as err:
+                return jsonify({'error': str(err)}), 400
+        return jsonify({
+            'latency': fake.latency, 'jitter': fake.jitter, 'error_rate': fake.error_rate,
+            'throttle_rate': fake.throttle_rate, 'etags': fake.etags, 'requests': fake.requests,
+            'counts': {kind: len(records) for kind, records in fake.lists.items()},
+        })
+
+    return fake_app
+
+
+# Adapter do requests que entrega as chamadas direto ao app falso, sem abrir sockets:
+# asaas.session.mount('https://fake.asaas/', FakeAsaasAdapter(create_app()))
+class FakeAsaasAdapter(BaseAdapter):
+    def __init__(self, fake_app):
+        super().__init__()
+        self.client = fake_app.test_client()
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        url = requests.utils.urlparse(request.url)
+        body = request.body.encode('utf-8') if isinstance(request.body, str) else request.body
+        wsgi_response = self.client.open(
+            url.path, method=request.method, query_string=url.query, headers=dict(request.headers), data=body,
+        )
+
+        response = requests.Response()
+        response.status_code = wsgi_response.status_code
+        response.reason = wsgi_response.status.split(' ', 1)[-1]
+        response.headers = requests.structures.CaseInsensitiveDict(wsgi_response.headers)
+        response.raw = io.BytesIO(wsgi_response.get_data())
+        response.url = request.url
+        response.request = request
+        response.encoding = 'utf-8'
+        return response
+
+    def close(self):
+        pass
+
+
+@click.command()
+@click.option('--host', default='127.0.0.1')
+@click.option('--port', default=5001, type=int)
+@click.option('--customers', default=FAKE_ASAAS_CUSTOMERS, type=int, help='Quantidade de clientes gerados.')
+@click.option('--latency', default=FAKE_ASAAS_LATENCY, type=float, help='Latência de cada resposta, em segundos.')
+@click.option('--jitter', default=FAKE_ASAAS_JITTER, type=float, help='Variação máxima (+/-) da latência.')
+@click.option('--error-rate', default=FAKE_ASAAS_ERROR_RATE, type=float, help='Fração das chamadas que recebem 500.')
+@click.option('--throttle-rate', default=FAKE_ASAAS_THROTTLE_RATE, type=float, help='Fração das chamadas que recebem 429.')
+@click.option('--seed', default=FAKE_ASAAS_SEED, type=int)
+@click.option('--etags/--no-etags', default=FAKE_ASAAS_ETAGS, help='Envia ETag e responde 304 a If-None-Match.')
+def main(host, port, customers, latency, jitter, error_rate, throttle_rate, seed, etags):
+    fake = FakeAsaas(customers, latency, jitter, error_rate, throttle_rate, seed, etags)
+    click.echo(f'Fake Asaas em http://{host}:{port}{API_PREFIX} com {customers} clientes')
+    create_app(fake).run(host=host, port=port, threaded=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+import itertools
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from metrics import with_current_trace
+
+# Limite de chamadas simultâneas à API do Asaas por fan-out (ajuste conforme o rate limit da conta)
+MAX_CONCURRENCY = int(os.environ.get('ASAAS_MAX_CONCURRENCY', 8))
+
+# Novas tentativas para falhas temporárias (limite de requisições, erro do servidor ou de conexão)
+RETRY_ATTEMPTS = int(os.environ.get('ASAAS_RETRY_ATTEMPTS', 3))
+RETRY_BACKOFF = float(os.environ.get('ASAAS_RETRY_BACKOFF', 0.5))
+
+
+# Executa func para cada item em paralelo, com no máximo max_workers chamadas simultâneas,
+# devolvendo os resultados na mesma ordem dos itens. progress(concluídos, total) é chamado a cada item.
+def fan_out(func, items, max_workers=MAX_CONCURRENCY, progress=None):
+    items = list(items)
+    func = with_current_trace(func)
+    if progress is not None:
+        func = _with_progress(func, progress, len(items))
+    workers = max(1, min(max_workers, len(items)))
+    if workers == 1:
+        return [func(item) for item in items]
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='asaas-fanout') as executor:
+        return list(executor.map(func, items))
+
+
+def _with_progress(func, progress, total):
+    counter = itertools.count(1)
+    lock = threading.Lock()
+
+    def tracked(item):
+        result = func(item)
+        with lock:
+            done = next(counter)
+        progress(done, total)
+        return result
+    return tracked
+
+
+def is_retryable_status(status):
+    return status == 429 or status >= 500
+
+
+# Chama func() (que devolve (dados, status) como os helpers do app) com novas tentativas
+# e espera exponencial enquanto a falha for temporária
+def call_with_retry(func, attempts=RETRY_ATTEMPTS, backoff=RETRY_BACKOFF):
+    for attempt in range(1, attempts + 1):
+        try:
+            result = func()
+        except requests.exceptions.RequestException:
+            if attempt == attempts:
+                raise
+        else:
+            if attempt == attempts or not is_retryable_status(result[1]):
+                return result
+        time.sleep(backoff * 2 ** (attempt - 1))
@@ -0,0 +1,161 @@
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from store import SNAPSHOT_DB_PATH, add_missing_columns
+
+# Configurações da fila de tarefas em segundo plano (por padrão no mesmo banco do snapshot)
+JOBS_DB_PATH = os.environ.get('JOBS_DB_PATH', SNAPSHOT_DB_PATH)
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 2))
+
+ACTIVE_STATUSES = ('queued', 'running')
+
+
+# Processo que executa a tarefa (máquina:pid), gravado com ela
+def process_owner():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+# Fila de tarefas demoradas (operações em lote, sincronização) executadas por um pool de threads,
+# com o estado de cada tarefa gravado em SQLite para consulta de progresso.
+# Vários processos (workers do servidor, `flask sync-snapshot`) podem usar o mesmo banco: cada tarefa
+# guarda o processo dono, e só é dada como interrompida quando esse processo não existe mais.
+class JobQueue:
+    def __init__(self, path=JOBS_DB_PATH, workers=JOB_WORKERS):
+        self._lock = threading.Lock()
+        self._active = set()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='jobs')
+        with self._lock, self._conn:
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS jobs ('
+                'id TEXT PRIMARY KEY, account TEXT NOT NULL, kind TEXT NOT NULL, status TEXT NOT NULL, '
+                'done INTEGER NOT NULL DEFAULT 0, total INTEGER, result TEXT, error TEXT, '
+                'created_at REAL NOT NULL, updated_at REAL NOT NULL, owner TEXT)'
+            )
+            add_missing_columns(self._conn, 'jobs', {'owner': 'TEXT'})
+
+    def _update(self, job_id, **fields):
+        fields['updated_at'] = time.time()
+        assignments = ', '.join(f'{name} = ?' for name in fields)
+        with self._lock, self._conn:
+            self._conn.execute(f'UPDATE jobs SET {assignments} WHERE id = ?', (*fields.values(), job_id))
+
+    # Grava a tarefa na fila; com exclusive, só se a conta não tiver outra do mesmo tipo na fila ou rodando.
+    # Devolve o id da tarefa, ou None se ela não foi criada.
+    def _create(self, account, kind, exclusive=False):
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        statement = (
+            "INSERT INTO jobs (id, account, kind, status, created_at, updated_at, owner) "
+            "SELECT ?, ?, ?, 'queued', ?, ?, ?"
+        )
+        params = [job_id, account, kind, now, now, process_owner()]
+        if exclusive:
+            statement += (
+                " WHERE NOT EXISTS (SELECT 1 FROM jobs "
+                "WHERE account = ? AND kind = ? AND status IN ('queued', 'running'))"
+            )
+            params += [account, kind]
+        with self._lock, self._conn:
+            self._active.add(job_id)
+            if self._conn.execute(statement, params).rowcount == 1:
+                return job_id
+            self._active.discard(job_id)
+        return None
+
+    # Enfileira func(*args, progress=..., **kwargs) e devolve o id da tarefa imediatamente
+    def submit(self, account, kind, func, *args, **kwargs):
+        job_id = self._create(account, kind)
+        self._executor.submit(self._run, job_id, func, args, kwargs)
+        return job_id
+
+    # Como submit, mas se a conta já tiver uma tarefa do mesmo tipo na fila ou rodando, devolve a dela.
+    # Devolve (id da tarefa, True se ela foi criada agora).
+    def submit_once(self, account, kind, func, *args, **kwargs):
+        while True:
+            for job in self._jobs(account, kind, ACTIVE_STATUSES):
+                if self._check_alive(job):
+                    return job['id'], False
+            job_id = self._create(account, kind, exclusive=True)
+            if job_id is not None:
+                self._executor.submit(self._run, job_id, func, args, kwargs)
+                return job_id, True
+
+    def _run(self, job_id, func, args, kwargs):
+        self._update(job_id, status='running')
+
+        def progress(done, total=None):
+            self._update(job_id, done=done, total=total)
+
+        try:
+            result = func(*args, progress=progress, **kwargs)
+        except Exception as err:
+            logging.exception('Job %s failed', job_id)
+            self._update(job_id, status='failed', error=str(err))
+        else:
+            self._update(job_id, status='done', result=json.dumps(result))
+        finally:
+            with self._lock:
+                self._active.discard(job_id)
+
+    # Se o processo dono de uma tarefa na fila ou rodando não existe mais, marca a tarefa como interrompida
+    # (ela não é retomada). Processos de outra máquina não podem ser verificados e são considerados vivos.
+    def _check_alive(self, job):
+        host, _, pid = (job['owner'] or '').rpartition(':')
+        if not pid:
+            alive = False
+        elif host != socket.gethostname():
+            alive = True
+        elif int(pid) == os.getpid():
+            with self._lock:
+                alive = job['id'] in self._active
+        else:
+            try:
+                os.kill(int(pid), 0)
+                alive = True
+            except ProcessLookupError:
+                alive = False
+            except PermissionError:
+                alive = True
+        if not alive:
+            with self._lock, self._conn:
+                self._conn.execute(
+                    "UPDATE jobs SET status = 'interrupted', updated_at = ? "
+                    "WHERE id = ? AND status IN ('queued', 'running')",
+                    (time.time(), job['id']),
+                )
+            job['status'] = 'interrupted'
+        return alive
+
+    def _jobs(self, account, kind, statuses):
+        with self._lock:
+            rows = self._conn.execute(
+                f'SELECT * FROM jobs WHERE account = ? AND kind = ? AND status IN ({", ".join("?" * len(statuses))})',
+                (account, kind, *statuses),
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def get(self, job_id):
+        with self._lock:
+            row = self._conn.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        if job['status'] in ACTIVE_STATUSES:
+            self._check_alive(job)
+        job['result'] = json.loads(job['result']) if job['result'] else None
+        return job
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,310 @@
+import contextvars
+import functools
+import re
+import threading
+import time
+from bisect import bisect_left
+from urllib.parse import urlsplit
+
+# Limites (em segundos) dos histogramas de latência
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Ações conhecidas da API do Asaas depois do id (ex.: /subscriptions/{id}/debit); qualquer outro segmento
+# depois do nome da coleção vira {id}, para que valores vindos da URL do app não criem novas séries
+ENDPOINT_ACTIONS = frozenset({'debit', 'payments', 'restore', 'refund', 'identificationField', 'pixQrCode'})
+VERSION_SEGMENT = re.compile(r'^v\d+$')
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values):
+    if not names:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + '}'
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+# Métrica base com séries separadas por valores de labels
+class Metric:
+    kind = 'untyped'
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help_text = help_text
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(labels.get(name, '') for name in self.labels)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} {self.kind}']
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f'{self.name}{_format_labels(self.labels, key)} {_format_value(value)}')
+        return lines
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    # Para contadores mantidos fora daqui (ex.: acertos de cache), copiados pelos coletores
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                series = self._values[key] = {'counts': [0] * (len(self.buckets) + 1), 'sum': 0.0, 'count': 0}
+            series['counts'][bisect_left(self.buckets, value)] += 1
+            series['sum'] += value
+            series['count'] += 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} {self.kind}']
+        names = self.labels + ('le',)
+        with self._lock:
+            for key, series in sorted(self._values.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float('inf'),), series['counts']):
+                    cumulative += count
+                    le = '+Inf' if bound == float('inf') else repr(bound)
+                    lines.append(f'{self.name}_bucket{_format_labels(names, key + (le,))} {cumulative}')
+                lines.append(f'{self.name}_sum{_format_labels(self.labels, key)} {series["sum"]!r}')
+                lines.append(f'{self.name}_count{_format_labels(self.labels, key)} {series["count"]}')
+        return lines
+
+
+# Conjunto de métricas exportadas em /metrics, mais coletores chamados no momento da leitura
+class Registry:
+    def __init__(self):
+        self.metrics = []
+        self.collectors = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, help_text, labels=()):
+        return self.register(Counter(name, help_text, labels))
+
+    def gauge(self, name, help_text, labels=()):
+        return self.register(Gauge(name, help_text, labels))
+
+    def histogram(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, help_text, labels, buckets))
+
+    # collector() é chamado a cada leitura e atualiza gauges a partir de estatísticas externas
+    def add_collector(self, collector):
+        self.collectors.append(collector)
+
+    def render(self):
+        for collector in self.collectors:
+            collector()
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+upstream_requests = registry.counter(
+    'asaas_requests_total', 'Chamadas à API do Asaas', ('method', 'endpoint', 'status'))
+upstream_duration = registry.histogram(
+    'asaas_request_duration_seconds', 'Duração das chamadas à API do Asaas', ('method', 'endpoint'))
+upstream_bytes = registry.counter(
+    'asaas_response_bytes_total', 'Bytes recebidos da API do Asaas', ('method', 'endpoint'))
+upstream_decode = registry.histogram(
+    'asaas_json_decode_seconds', 'Tempo de decodificação do JSON das respostas do Asaas', ('endpoint',))
+upstream_in_flight = registry.gauge(
+    'asaas_requests_in_flight', 'Chamadas à API do Asaas em andamento')
+upstream_revalidations = registry.counter(
+    'asaas_revalidations_total',
+    'GETs repetidos: not_modified (304), unchanged (mesmo corpo, sem nova decodificação) ou changed',
+    ('result',))
+upstream_coalesced = registry.counter(
+    'asaas_coalesced_requests_total', 'GETs atendidos por uma chamada idêntica já em andamento', ('endpoint',))
+
+route_requests = registry.counter(
+    'http_requests_total', 'Requisições atendidas pelo app', ('route', 'method', 'status'))
+route_duration = registry.histogram(
+    'http_request_duration_seconds', 'Duração das requisições atendidas pelo app', ('route', 'method'))
+route_in_flight = registry.gauge(
+    'http_requests_in_flight', 'Requisições do app em andamento')
+template_duration = registry.histogram(
+    'template_render_seconds', 'Tempo de renderização dos templates Jinja', ('template',))
+
+scheduler_wait = registry.histogram(
+    'asaas_scheduler_wait_seconds', 'Tempo de espera na fila do limite de requisições por chave de API')
+scheduler_throttled = registry.counter(
+    'asaas_throttled_total', 'Respostas 429 recebidas do Asaas')
+
+# Alimentadas pelos coletores registrados no app a cada leitura de /metrics
+cache_hits = registry.counter('cache_hits_total', 'Leituras atendidas pelo cache', ('cache',))
+cache_misses = registry.counter('cache_misses_total', 'Leituras que não encontraram o registro no cache', ('cache',))
+cache_hit_ratio = registry.gauge('cache_hit_ratio', 'Proporção de leituras atendidas pelo cache', ('cache',))
+cache_entries = registry.gauge('cache_entries', 'Registros armazenados no cache', ('cache',))
+
+
+# Caminho do endpoint sem o prefixo da API e sem os ids, para agrupar as métricas (ex.: /customers/{id})
+def endpoint_label(url):
+    segments = [segment for segment in urlsplit(url).path.split('/') if segment]
+    for index, segment in enumerate(segments):
+        if VERSION_SEGMENT.match(segment):
+            segments = segments[index + 1:]
+            break
+    normalized = [segments[0]] if segments else []
+    normalized += [segment if segment in ENDPOINT_ACTIONS else '{id}' for segment in segments[1:]]
+    return '/' + '/'.join(normalized)
+
+
+# Registra uma chamada à API do Asaas já concluída
+def observe_upstream(method, endpoint, status, nbytes, duration):
+    upstream_requests.inc(method=method, endpoint=endpoint, status=status)
+    upstream_duration.observe(duration, method=method, endpoint=endpoint)
+    upstream_bytes.inc(nbytes, method=method, endpoint=endpoint)
+
+
+# Contador de chamadas em andamento para uso em blocos with
+class InFlight:
+    def __init__(self, gauge):
+        self.gauge = gauge
+
+    def __enter__(self):
+        self.gauge.inc()
+        self.started_at = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.gauge.dec()
+        self.elapsed = time.perf_counter() - self.started_at
+        return False
+
+
+# Tempos e chamadas ao Asaas de uma única requisição do app, usados no cabeçalho Server-Timing
+# e no painel de chamadas (?timing=1)
+class RequestTrace:
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.calls = []
+        self.durations = {}
+        self._lock = threading.Lock()
+
+    def add_duration(self, name, seconds):
+        with self._lock:
+            self.durations[name] = self.durations.get(name, 0.0) + seconds
+
+    def add_call(self, method, url, status, started_at, duration, nbytes):
+        call = {
+            'method': method,
+            'url': url,
+            'status': status,
+            'offset': started_at - self.started_at,
+            'duration': duration,
+            'bytes': nbytes,
+            'thread': threading.current_thread().name,
+        }
+        with self._lock:
+            self.calls.append(call)
+        self.add_duration('upstream', duration)
+
+    def elapsed(self):
+        return time.perf_counter() - self.started_at
+
+    # Valor do cabeçalho Server-Timing (durações em milissegundos). O tempo do Asaas é a soma
+    # das chamadas, que pode passar do tempo total quando elas rodam em paralelo.
+    def server_timing(self):
+        with self._lock:
+            durations = dict(self.durations)
+            calls = len(self.calls)
+        entries = []
+        for name, seconds in durations.items():
+            desc = f';desc="{calls} calls"' if name == 'upstream' else ''
+            entries.append(f'{name};dur={seconds * 1000:.1f}{desc}')
+        entries.append(f'total;dur={self.elapsed() * 1000:.1f}')
+        return ', '.join(entries)
+
+    # Chamadas em ordem de início, com a posição das barras do painel em % do tempo total
+    def waterfall(self):
+        total = max(self.elapsed(), 1e-9)
+        with self._lock:
+            calls = sorted(self.calls, key=lambda call: call['offset'])
+        return [
+            dict(call, left=100 * call['offset'] / total, width=max(100 * call['duration'] / total, 0.5))
+            for call in calls
+        ]
+
+
+current_trace = contextvars.ContextVar('current_trace', default=None)
+
+
+# Soma o tempo de func ao item `name` do trace da requisição em andamento (se houver)
+def timed(name):
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            trace = current_trace.get()
+            if trace is None:
+                return func(*args, **kwargs)
+            started_at = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                trace.add_duration(name, time.perf_counter() - started_at)
+        return wrapper
+    return decorator
+
+
+# Leva o trace da requisição atual para func quando ela roda em outra thread (pools de fan-out e prefetch)
+def with_current_trace(func):
+    trace = current_trace.get()
+    if trace is None:
+        return func
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        token = current_trace.set(trace)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            current_trace.reset(token)
+    return wrapper
@@ -0,0 +1,55 @@
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Threads que atualizam em segundo plano as páginas servidas do cache (stale-while-revalidate)
+REFRESH_WORKERS = int(os.environ.get('REFRESH_WORKERS', 2))
+
+
+# Atualizações em segundo plano agrupadas por chave (a chave de API): enquanto uma atualização
+# da chave está rodando, novos pedidos entram na fila dela em vez de abrir outra execução,
+# e pedidos repetidos para o mesmo item são descartados
+class BackgroundRefresher:
+    def __init__(self, workers=REFRESH_WORKERS):
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='refresh')
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    # Agenda func(item) para a chave; devolve False se o item já estava na fila
+    def submit(self, key, item, func):
+        with self._lock:
+            pending = self._pending.get(key)
+            if pending is not None:
+                if item in pending:
+                    return False
+                pending[item] = func
+                return True
+            self._pending[key] = {item: func}
+        self._executor.submit(self._run, key)
+        return True
+
+    def _run(self, key):
+        while True:
+            with self._lock:
+                pending = self._pending[key]
+                if not pending:
+                    del self._pending[key]
+                    return
+                item = next(iter(pending))
+                func = pending[item]
+            try:
+                func(item)
+            except Exception:
+                logging.exception('Background refresh of %r failed', item)
+            finally:
+                # Só sai da fila depois de rodar, para que pedidos do mesmo item durante a execução sejam descartados
+                with self._lock:
+                    pending.pop(item, None)
+
+    def pending(self, key):
+        with self._lock:
+            return list(self._pending.get(key, ()))
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
@@ -0,0 +1,54 @@
+// Carrega as listas da página inicial a partir de /fragments/<lista>, em paralelo,
+// e busca a próxima página quando o último item aparece na tela (rolagem infinita)
+(function () {
+    var observer = 'IntersectionObserver' in window ? new IntersectionObserver(function (entries) {
+        entries.forEach(function (entry) {
+            if (entry.isIntersecting) {
+                observer.unobserve(entry.target);
+                loadPage(entry.target.parentNode, entry.target.getAttribute('data-next'), entry.target);
+            }
+        });
+    }, { rootMargin: '200px' }) : null;
+
+    function loadPage(list, url, placeholder) {
+        fetch(url, { credentials: 'same-origin' })
+            .then(function (response) {
+                if (response.status === 401) {
+                    window.location.reload();
+                }
+                var kind = list.getAttribute('data-fragment');
+                var total = document.querySelector('[data-total="' + kind + '"]');
+                var asOf = document.querySelector('[data-as-of]');
+                if (total && response.headers.get('X-Total-Count') !== null) {
+                    total.textContent = response.headers.get('X-Total-Count');
+                }
+                if (asOf && response.headers.get('X-Data-As-Of')) {
+                    asOf.textContent = response.headers.get('X-Data-As-Of');
+                }
+                return response.text();
+            })
+            .then(function (html) {
+                if (placeholder) {
+                    placeholder.remove();
+                }
+                list.insertAdjacentHTML('beforeend', html);
+                var next = list.querySelector('.load-more[data-next]');
+                if (next && observer) {
+                    observer.observe(next);
+                } else if (next) {
+                    next.innerHTML = '<a href="#">Carregar mais</a>';
+                    next.onclick = function (event) {
+                        event.preventDefault();
+                        loadPage(list, next.getAttribute('data-next'), next);
+                    };
+                }
+            })
+            .catch(function () {
+                list.insertAdjacentHTML('beforeend', '<li class="danger">Erro ao carregar a lista.</li>');
+            });
+    }
+
+    document.querySelectorAll('ul[data-fragment]').forEach(function (list) {
+        loadPage(list, list.getAttribute('data-src'), null);
+    });
+})();
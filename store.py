@@ -0,0 +1,283 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from metrics import timed
+
+# Caminho do banco local com a cópia (snapshot) dos dados do Asaas
+SNAPSHOT_DB_PATH = os.environ.get('SNAPSHOT_DB_PATH', 'snapshot.db')
+
+# Colunas indexadas de cada tabela (o registro completo fica na coluna data, em JSON)
+TABLES = {
+    'customers': {'name': 'name', 'email': 'email', 'date_created': 'dateCreated'},
+    'subscriptions': {'customer': 'customer', 'status': 'status', 'next_due_date': 'nextDueDate', 'date_created': 'dateCreated'},
+    'payments': {'customer': 'customer', 'subscription': 'subscription', 'status': 'status', 'due_date': 'dueDate', 'date_created': 'dateCreated'},
+}
+
+TABLES_BY_OBJECT = {'customer': 'customers', 'subscription': 'subscriptions', 'payment': 'payments'}
+
+INDEXES = [
+    'CREATE INDEX IF NOT EXISTS customers_name ON customers (account, name)',
+    'CREATE INDEX IF NOT EXISTS subscriptions_customer ON subscriptions (account, customer)',
+    'CREATE INDEX IF NOT EXISTS subscriptions_status ON subscriptions (account, status)',
+    'CREATE INDEX IF NOT EXISTS payments_customer ON payments (account, customer)',
+    'CREATE INDEX IF NOT EXISTS payments_status ON payments (account, status)',
+]
+
+
+# Acrescenta a uma tabela já existente as colunas criadas depois dela (bancos de versões anteriores);
+# devolve os nomes das colunas acrescentadas
+def add_missing_columns(conn, table, columns):
+    existing = {row[1] for row in conn.execute(f'PRAGMA table_info({table})')}
+    added = [name for name in columns if name not in existing]
+    for name in added:
+        conn.execute(f'ALTER TABLE {table} ADD COLUMN {name} {columns[name]}')
+    return added
+
+
+# Identificador da conta no banco local (nunca gravamos a chave de API em si)
+def account_id(api_key):
+    return hashlib.sha256(api_key.encode('utf-8')).hexdigest()
+
+
+# Armazenamento local em SQLite de clientes, assinaturas e pagamentos, por conta
+class SnapshotStore:
+    def __init__(self, path=SNAPSHOT_DB_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock, self._conn:
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            for table, columns in TABLES.items():
+                extra = ''.join(f', {column} TEXT' for column in columns)
+                self._conn.execute(
+                    f'CREATE TABLE IF NOT EXISTS {table} ('
+                    f'account TEXT NOT NULL, id TEXT NOT NULL{extra}, data TEXT NOT NULL, stored_at REAL, '
+                    f'PRIMARY KEY (account, id))'
+                )
+                add_missing_columns(self._conn, table, {'stored_at': 'REAL'})
+            for statement in INDEXES:
+                self._conn.execute(statement)
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS sync_state ('
+                'account TEXT NOT NULL, kind TEXT NOT NULL, last_sync REAL NOT NULL, '
+                'PRIMARY KEY (account, kind))'
+            )
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS webhook_events ('
+                'id TEXT PRIMARY KEY, received_at REAL NOT NULL, account TEXT, payload TEXT, '
+                'processed_at REAL, attempts INTEGER NOT NULL DEFAULT 0)'
+            )
+            added = add_missing_columns(self._conn, 'webhook_events', {
+                'account': 'TEXT', 'payload': 'TEXT', 'processed_at': 'REAL', 'attempts': 'INTEGER NOT NULL DEFAULT 0',
+            })
+            if 'processed_at' in added:
+                # Eventos recebidos antes da coluna existir não têm o conteúdo gravado e não podem ser reaplicados
+                self._conn.execute('UPDATE webhook_events SET processed_at = received_at')
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS reminder_keys ('
+                'key TEXT PRIMARY KEY, account TEXT NOT NULL, customer TEXT NOT NULL, '
+                'payment TEXT, created_at REAL NOT NULL)'
+            )
+
+    # Grava (insert ou update) os registros; linhas cujo JSON não mudou não são reescritas
+    @timed('snapshot')
+    def upsert(self, account, table, records):
+        columns = TABLES[table]
+        names = ['account', 'id', *columns, 'stored_at', 'data']
+        updates = ', '.join(f'{name} = excluded.{name}' for name in names[2:])
+        statement = (
+            f'INSERT INTO {table} ({", ".join(names)}) VALUES ({", ".join("?" * len(names))}) '
+            f'ON CONFLICT (account, id) DO UPDATE SET {updates} WHERE data != excluded.data'
+        )
+        now = time.time()
+        rows = [
+            (account, record['id'], *(record.get(field) for field in columns.values()), now, json.dumps(record))
+            for record in records
+            if record.get('id')
+        ]
+        with self._lock, self._conn:
+            self._conn.executemany(statement, rows)
+        return len(rows)
+
+    # Grava um único objeto do Asaas (customer, subscription ou payment)
+    def upsert_object(self, account, record):
+        table = TABLES_BY_OBJECT.get(record.get('object'))
+        if table is None or not record.get('id'):
+            return False
+        self.upsert(account, table, [record])
+        return True
+
+    def delete(self, account, table, record_id):
+        with self._lock, self._conn:
+            self._conn.execute(f'DELETE FROM {table} WHERE account = ? AND id = ?', (account, record_id))
+
+    # Remove os registros da conta que não vieram numa leitura completa da listagem (excluídos no Asaas).
+    # Registros gravados depois de before (webhooks, alterações feitas pelo painel durante a leitura) são mantidos.
+    @timed('snapshot')
+    def prune(self, account, table, seen_ids, before):
+        with self._lock, self._conn:
+            self._conn.execute('CREATE TEMP TABLE IF NOT EXISTS seen_ids (id TEXT PRIMARY KEY)')
+            self._conn.executemany('INSERT OR IGNORE INTO seen_ids (id) VALUES (?)', ((i,) for i in seen_ids))
+            cursor = self._conn.execute(
+                f'DELETE FROM {table} WHERE account = ? AND COALESCE(stored_at, 0) < ? '
+                f'AND id NOT IN (SELECT id FROM seen_ids)',
+                (account, before),
+            )
+            self._conn.execute('DELETE FROM seen_ids')
+        return cursor.rowcount
+
+    # Contas que já têm o registro (ou, para assinaturas e pagamentos, o cliente dele) no banco local
+    def accounts_for(self, record):
+        table = TABLES_BY_OBJECT.get(record.get('object'))
+        if table is None or not record.get('id'):
+            return []
+        statement = f'SELECT account FROM {table} WHERE id = ?'
+        params = [record['id']]
+        if table != 'customers' and record.get('customer'):
+            statement += ' UNION SELECT account FROM customers WHERE id = ?'
+            params.append(record['customer'])
+        with self._lock:
+            return [row['account'] for row in self._conn.execute(statement, params).fetchall()]
+
+    # Grava um evento de webhook (e a conta da URL dele, se houver); devolve False se ele já tinha sido recebido
+    def record_event(self, event, account=None):
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                'INSERT OR IGNORE INTO webhook_events (id, received_at, account, payload) VALUES (?, ?, ?, ?)',
+                (event['id'], time.time(), account, json.dumps(event)),
+            )
+        return cursor.rowcount == 1
+
+    def complete_event(self, event_id):
+        with self._lock, self._conn:
+            self._conn.execute('UPDATE webhook_events SET processed_at = ? WHERE id = ?', (time.time(), event_id))
+
+    def fail_event(self, event_id):
+        with self._lock, self._conn:
+            self._conn.execute('UPDATE webhook_events SET attempts = attempts + 1 WHERE id = ?', (event_id,))
+
+    # Eventos recebidos antes de received_before que ainda não foram aplicados, como pares (evento, conta)
+    def pending_events(self, received_before, max_attempts):
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT account, payload FROM webhook_events '
+                'WHERE processed_at IS NULL AND received_at < ? AND attempts < ? ORDER BY received_at',
+                (received_before, max_attempts),
+            ).fetchall()
+        return [(json.loads(row['payload']), row['account']) for row in rows]
+
+    # Reserva a chave de idempotência de um alerta de cobrança; devolve False se ela já foi usada
+    def claim_reminder(self, key, account, customer):
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                'INSERT OR IGNORE INTO reminder_keys (key, account, customer, created_at) VALUES (?, ?, ?, ?)',
+                (key, account, customer, time.time()),
+            )
+        return cursor.rowcount == 1
+
+    def has_reminder(self, key):
+        with self._lock:
+            return self._conn.execute('SELECT 1 FROM reminder_keys WHERE key = ?', (key,)).fetchone() is not None
+
+    def complete_reminder(self, key, payment_id):
+        with self._lock, self._conn:
+            self._conn.execute('UPDATE reminder_keys SET payment = ? WHERE key = ?', (payment_id, key))
+
+    # Libera a chave quando a cobrança não foi criada, para que uma nova execução tente de novo
+    def release_reminder(self, key):
+        with self._lock, self._conn:
+            self._conn.execute('DELETE FROM reminder_keys WHERE key = ? AND payment IS NULL', (key,))
+
+    @timed('snapshot')
+    def get(self, account, table, record_id):
+        with self._lock:
+            row = self._conn.execute(
+                f'SELECT data FROM {table} WHERE account = ? AND id = ?', (account, record_id)
+            ).fetchone()
+        return json.loads(row['data']) if row else None
+
+    # Busca registros por id, devolvendo {id: registro} apenas com os encontrados
+    @timed('snapshot')
+    def get_many(self, account, table, record_ids):
+        record_ids = [record_id for record_id in set(record_ids) if record_id]
+        if not record_ids:
+            return {}
+        with self._lock:
+            rows = self._conn.execute(
+                f'SELECT id, data FROM {table} WHERE account = ? AND id IN ({", ".join("?" * len(record_ids))})',
+                [account, *record_ids],
+            ).fetchall()
+        return {row['id']: json.loads(row['data']) for row in rows}
+
+    # Monta o WHERE das listagens: colunas indexadas e, opcionalmente, busca pelo nome do cliente
+    def _where(self, account, table, filters, search=None):
+        where = ['account = ?']
+        params = [account]
+        for column, value in filters.items():
+            if column not in TABLES[table]:
+                raise ValueError(f'Unknown column {column} for {table}')
+            where.append(f'{column} = ?')
+            params.append(value)
+        if search:
+            pattern = '%' + search.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+            if table == 'customers':
+                where.append("name LIKE ? ESCAPE '\\'")
+            else:
+                where.append("customer IN (SELECT id FROM customers WHERE account = ? AND name LIKE ? ESCAPE '\\')")
+                params.append(account)
+            params.append(pattern)
+        return ' AND '.join(where), params
+
+    # Lista registros filtrando pelas colunas indexadas (ex.: customer='cus_123', status='OVERDUE')
+    @timed('snapshot')
+    def list(self, account, table, **filters):
+        where, params = self._where(account, table, filters)
+        with self._lock:
+            rows = self._conn.execute(
+                f'SELECT data FROM {table} WHERE {where} ORDER BY date_created DESC, id', params,
+            ).fetchall()
+        return [json.loads(row['data']) for row in rows]
+
+    # Uma página da listagem e o total de registros que atendem aos filtros.
+    # search filtra pelo nome do cliente (sem diferenciar maiúsculas de minúsculas).
+    @timed('snapshot')
+    def page(self, account, table, limit, offset=0, search=None, **filters):
+        where, params = self._where(account, table, filters, search)
+        with self._lock:
+            total = self._conn.execute(f'SELECT COUNT(*) FROM {table} WHERE {where}', params).fetchone()[0]
+            rows = self._conn.execute(
+                f'SELECT data FROM {table} WHERE {where} ORDER BY date_created DESC, id LIMIT ? OFFSET ?',
+                [*params, limit, offset],
+            ).fetchall()
+        return [json.loads(row['data']) for row in rows], total
+
+    @timed('snapshot')
+    def last_sync(self, account, kind):
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT last_sync FROM sync_state WHERE account = ? AND kind = ?', (account, kind)
+            ).fetchone()
+        return row['last_sync'] if row else None
+
+    def mark_synced(self, account, kind, timestamp=None):
+        with self._lock, self._conn:
+            self._conn.execute(
+                'INSERT INTO sync_state (account, kind, last_sync) VALUES (?, ?, ?) '
+                'ON CONFLICT (account, kind) DO UPDATE SET last_sync = excluded.last_sync',
+                (account, kind, timestamp if timestamp is not None else time.time()),
+            )
+
+    # Momento da sincronização completa mais antiga das tabelas da conta (None se alguma nunca foi sincronizada).
+    # Sincronizações incrementais não contam: elas não relêem o status dos registros já gravados.
+    def synced_at(self, account, tables=TABLES):
+        timestamps = [self.last_sync(account, f'{table}:full') for table in tables]
+        return None if None in timestamps else min(timestamps)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,71 @@
+import logging
+import os
+import queue
+import threading
+import time
+
+# Eventos gravados e ainda não aplicados há mais de WEBHOOK_RETRY_AFTER segundos (falha ao aplicar ou processo
+# encerrado com o evento na fila) são reaplicados, até WEBHOOK_MAX_ATTEMPTS tentativas
+WEBHOOK_RETRY_AFTER = int(os.environ.get('WEBHOOK_RETRY_AFTER', 60))
+WEBHOOK_MAX_ATTEMPTS = int(os.environ.get('WEBHOOK_MAX_ATTEMPTS', 5))
+
+
+# Fila de eventos de webhook processada por uma thread em segundo plano,
+# para que a rota responda ao Asaas sem esperar a aplicação do evento.
+# O evento é gravado no banco antes da resposta e só marcado como aplicado depois que handler termina,
+# então nada se perde se o handler falhar ou o processo parar (o Asaas não reenvia depois do 200).
+class WebhookProcessor:
+    def __init__(self, handler, store, retry_after=WEBHOOK_RETRY_AFTER, max_attempts=WEBHOOK_MAX_ATTEMPTS):
+        self.handler = handler
+        self.store = store
+        self.retry_after = retry_after
+        self.max_attempts = max_attempts
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    # Inicia a thread (também chamada no início do app, para reaplicar os eventos pendentes)
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='asaas-webhooks', daemon=True)
+                self._thread.start()
+
+    # Enfileira um evento já gravado com store.record_event
+    def submit(self, event, account=None):
+        self.start()
+        self._queue.put((event, account))
+
+    def _run(self):
+        next_retry = time.monotonic() + self.retry_after
+        while True:
+            try:
+                event, account = self._queue.get(timeout=max(next_retry - time.monotonic(), 0))
+            except queue.Empty:
+                pass
+            else:
+                try:
+                    self._apply(event, account)
+                finally:
+                    self._queue.task_done()
+            if time.monotonic() >= next_retry:
+                self._retry_pending()
+                next_retry = time.monotonic() + self.retry_after
+
+    def _apply(self, event, account):
+        try:
+            self.handler(event, account)
+        except Exception:
+            logging.exception('Failed to apply webhook event %s', event.get('id'))
+            self.store.fail_event(event['id'])
+        else:
+            self.store.complete_event(event['id'])
+
+    def _retry_pending(self):
+        for event, account in self.store.pending_events(time.time() - self.retry_after, self.max_attempts):
+            logging.info('Retrying webhook event %s', event.get('id'))
+            self._apply(event, account)
+
+    # Aguarda a fila esvaziar (útil em testes e no desligamento)
+    def join(self):
+        self._queue.join()